@@ -77,6 +77,19 @@
 
   const donateBtn = document.getElementById('donateBtn');
   const donationAmountInput = document.getElementById('donationAmount');
+  // One key per donation attempt: retrying the same amount after a failure reuses it,
+  // so the gateway doesn't create a second payment
+  let donationKey = null;
+  let donationKeyAmount = null;
+  const idempotencyKey = (amount) => {
+    if (!donationKey || donationKeyAmount !== amount) {
+      donationKey = window.crypto && crypto.randomUUID
+        ? crypto.randomUUID()
+        : Date.now().toString(16) + '-' + Math.random().toString(16).slice(2);
+      donationKeyAmount = amount;
+    }
+    return donationKey;
+  };
   if (donateBtn && donationAmountInput) {
     donateBtn.addEventListener('click', async () => {
       const raw = donationAmountInput.value.trim();
@@ -91,7 +104,7 @@
         donateBtn.textContent = 'Отправка...';
         const res = await fetch('http://localhost:8787/api/create-payment', {
           method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
+          headers: { 'Content-Type': 'application/json', 'Idempotency-Key': idempotencyKey(amount) },
           body: JSON.stringify({ amount })
         });
         const data = await res.json().catch(() => ({ ok: false }));
@@ -102,6 +115,7 @@
           }
           donateBtn.textContent = 'Спасибо!';
           donationAmountInput.value = '';
+          donationKey = null;
         } else {
           donateBtn.textContent = 'Ошибка';
         }
@@ -0,0 +1,72 @@
+import datetime
+import os
+
+import storage
+
+# Fired reminders go into one table per month (reminders_archive_YYYYMM), so old
+# history is dropped whole instead of deleted row by row
+ARCHIVE_PREFIX = 'reminders_archive_'
+
+# How many months of history to keep, counting the current one
+ARCHIVE_RETENTION_MONTHS = int(os.environ.get('ARCHIVE_RETENTION_MONTHS', '12'))
+
+
+def table_name(ts):
+    return ARCHIVE_PREFIX + datetime.datetime.fromtimestamp(ts).strftime('%Y%m')
+
+
+def _tables(conn):
+    rows = conn.execute('''SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ?''', (ARCHIVE_PREFIX + '[0-9][0-9][0-9][0-9][0-9][0-9]',)).fetchall()
+    return sorted((row[0] for row in rows), reverse=True)
+
+
+# Copy the given reminders into this month's archive table. Runs inside the
+# caller's write transaction, before the rows are deleted or moved forward.
+def archive_fired(conn, reminder_ids, fired_at):
+    if not reminder_ids:
+        return
+    table = table_name(fired_at)
+    conn.execute(f'''CREATE TABLE IF NOT EXISTS {table} (
+        reminder_id INTEGER NOT NULL,
+        chat_id INTEGER NOT NULL,
+        reminder_text TEXT NOT NULL,
+        reminder_date INTEGER NOT NULL,
+        reminder_type TEXT NOT NULL,
+        fired_at INTEGER NOT NULL)''')
+    conn.execute(f'''CREATE INDEX IF NOT EXISTS idx_{table}_fired ON {table} (fired_at)''')
+    conn.execute(f'''INSERT INTO {table} (reminder_id, chat_id, reminder_text, reminder_date, reminder_type, fired_at)
+        SELECT id, chat_id, reminder_text, reminder_date, reminder_type, ? FROM reminders WHERE id IN ({','.join('?' * len(reminder_ids))})''', (fired_at, *reminder_ids))
+
+
+# Drop month tables older than the retention period and hand the freed pages
+# back to the file system (the database runs with auto_vacuum = INCREMENTAL)
+def prune():
+    cutoff = datetime.date.today().replace(day=1)
+    for _ in range(ARCHIVE_RETENTION_MONTHS - 1):
+        cutoff = (cutoff - datetime.timedelta(days=1)).replace(day=1)
+    oldest_kept = ARCHIVE_PREFIX + cutoff.strftime('%Y%m')
+
+    def drop_old(conn):
+        dropped = [table for table in _tables(conn) if table < oldest_kept]
+        for table in dropped:
+            conn.execute(f'''DROP TABLE {table}''')
+        return dropped
+    dropped = storage.write(drop_old).result()
+    # Freed pages only exist once the drop is committed
+    if dropped:
+        storage.incremental_vacuum()
+    return dropped
+
+
+# Most recently fired reminders, newest first, reading month tables until `limit` rows are found
+def history(limit=20, chat_id=None):
+    rows = []
+    with storage.reader() as conn:
+        for table in _tables(conn):
+            if chat_id is None:
+                rows += conn.execute(f'''SELECT chat_id, reminder_text, reminder_date, fired_at FROM {table} ORDER BY fired_at DESC LIMIT ?''', (limit - len(rows),)).fetchall()
+            else:
+                rows += conn.execute(f'''SELECT chat_id, reminder_text, reminder_date, fired_at FROM {table} WHERE chat_id = ? ORDER BY fired_at DESC LIMIT ?''', (chat_id, limit - len(rows))).fetchall()
+            if len(rows) >= limit:
+                break
+    return rows
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# Local stand-in for the Telegram Bot API (sendMessage, getUpdates and a generic
+# "ok" for everything else) with configurable latency and 429 injection.
+#
+#   python bench/fake_bot_api.py --port 9900 --latency 0.05 --fail-every 50
+#   TELEGRAM_API_URL='http://127.0.0.1:9900/bot{0}/{1}' python sroki.py
+import argparse
+import itertools
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeBotApi:
+    def __init__(self, latency=0.0, fail_every=0, retry_after=1):
+        self.latency = latency
+        self.fail_every = fail_every
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.calls = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.updates = []
+        self.stats = {'sendMessage': 0, 'texts': 0, 'characters': 0, 'too_many_requests': 0, 'getUpdates': 0, 'other': 0}
+
+    def handle(self, method, params):
+        if self.latency:
+            time.sleep(self.latency)
+        if method == 'sendMessage':
+            if self.fail_every and next(self.calls) % self.fail_every == 0:
+                with self.lock:
+                    self.stats['too_many_requests'] += 1
+                return 429, {'ok': False, 'error_code': 429, 'description': f'Too Many Requests: retry after {self.retry_after}', 'parameters': {'retry_after': self.retry_after}}
+            text = params.get('text', '')
+            with self.lock:
+                self.stats['sendMessage'] += 1
+                self.stats['texts'] += text.count('\n') + 1
+                self.stats['characters'] += len(text)
+            chat_id = params.get('chat_id', 0)
+            return 200, {'ok': True, 'result': {'message_id': next(self.message_ids), 'date': int(time.time()), 'chat': {'id': int(chat_id) if str(chat_id).lstrip('-').isdigit() else 0, 'type': 'group'}, 'text': text}}
+        if method == 'getUpdates':
+            with self.lock:
+                self.stats['getUpdates'] += 1
+                updates, self.updates = self.updates, []
+            return 200, {'ok': True, 'result': updates}
+        with self.lock:
+            self.stats['other'] += 1
+        return 200, {'ok': True, 'result': True}
+
+
+def make_handler(api):
+    class Handler(BaseHTTPRequestHandler):
+        def _params(self):
+            url = urlparse(self.path)
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                body = self.rfile.read(length).decode('utf-8')
+                if self.headers.get('Content-Type', '').startswith('application/json'):
+                    params.update(json.loads(body or '{}'))
+                else:
+                    params.update({key: values[-1] for key, values in parse_qs(body).items()})
+            return url.path, params
+
+        def _dispatch(self):
+            path, params = self._params()
+            if path == '/stats':
+                status, payload = 200, api.stats
+            else:
+                # /bot<token>/<method>
+                status, payload = api.handle(path.rsplit('/', 1)[-1], params)
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = _dispatch
+        do_POST = _dispatch
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+# Start the fake API in a background thread; returns (server, api)
+def start(port=0, latency=0.0, fail_every=0, retry_after=1):
+    api = FakeBotApi(latency, fail_every, retry_after)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(api))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, api
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Telegram Bot API')
+    parser.add_argument('--port', type=int, default=9900)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every call')
+    parser.add_argument('--fail-every', type=int, default=0, help='answer every Nth sendMessage with 429')
+    parser.add_argument('--retry-after', type=int, default=1)
+    args = parser.parse_args()
+    server, api = start(args.port, args.latency, args.fail_every, args.retry_after)
+    print(f"Fake Bot API on http://127.0.0.1:{server.server_address[1]}/bot{{0}}/{{1}} (stats: /stats)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# Fill a reminders database with synthetic rows for benchmarks.
+#
+#   python bench/gen_reminders.py --db bench.db --rows 1000000 --days 365
+import argparse
+import datetime
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage
+
+PRODUCTS = ['Молоко', 'Кефир', 'Сыр', 'Йогурт', 'Творог', 'Хлеб', 'Масло', 'Сметана', 'Колбаса', 'Сок']
+
+CHUNK = 50000
+
+
+# Insert `rows` reminders due between `start` and `start + days`, in chunks of CHUNK per transaction.
+# Like reminders entered in the bot, each falls on local midnight (so many rows share a date)
+# unless exact_times is set; `start` itself is kept as given.
+def fill(db_path, rows, start=None, days=30, chat_id=-1, seed=1, exact_times=False):
+    start = int(time.time()) if start is None else start
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    storage.migrate(conn)
+    midnight = datetime.datetime.fromtimestamp(start).replace(hour=0, minute=0, second=0, microsecond=0)
+    for offset in range(0, rows, CHUNK):
+        if exact_times:
+            dates = [start + rng.randrange(max(1, days * 86400)) for _ in range(min(CHUNK, rows - offset))]
+        else:
+            dates = [max(start, int((midnight + datetime.timedelta(days=rng.randrange(max(1, days) + 1))).timestamp())) for _ in range(min(CHUNK, rows - offset))]
+        batch = [(chat_id, f'{rng.choice(PRODUCTS)} партия {offset + i}', reminder_date) for i, reminder_date in enumerate(dates)]
+        conn.execute('''BEGIN''')
+        conn.executemany('''INSERT INTO reminders (chat_id, reminder_text, reminder_date) VALUES (?, ?, ?)''', batch)
+        conn.execute('''COMMIT''')
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic reminders')
+    parser.add_argument('--db', default='bench.db')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--days', type=int, default=30, help='spread of due dates from now')
+    parser.add_argument('--past', action='store_true', help='make every row already due')
+    parser.add_argument('--exact-times', action='store_true', help='random seconds instead of day-granular dates')
+    args = parser.parse_args()
+
+    start = int(time.time()) - args.days * 86400 - 1 if args.past else int(time.time())
+    began = time.perf_counter()
+    fill(args.db, args.rows, start, args.days, exact_times=args.exact_times)
+    print(f"{args.rows} rows in {time.perf_counter() - began:.2f}s -> {args.db}")
+
+
+if __name__ == '__main__':
+    main()
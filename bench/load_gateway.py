@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# Load generator for gateway.py: keep-alive clients send a weighted mix of
+# requests and report throughput, p50/p99 latency and status codes per route.
+# By default it starts the gateway in-process against bench/mock_yookassa.py;
+# --url points it at a gateway that is already running instead.
+#
+#   python bench/load_gateway.py --duration 20 --concurrency 64
+#   python bench/load_gateway.py --mix payment=1 --upstream-latency 0.2 --concurrency 200
+#   python bench/load_gateway.py --url http://staging:8787 --mix static=9,breathing=1
+import argparse
+import datetime
+import http.client
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import mock_yookassa
+from run_bench import timings, git_revision
+
+# Route weights when --mix isn't given: mostly page loads, a few donations
+DEFAULT_MIX = 'static=60,breathing=20,donate=5,payment=5,status=5,notify=5'
+
+STATIC_PATHS = ('/', '/main.js', '/style.css')
+BREATHING_PATHS = ('/breathing/', '/breathing/app.js', '/breathing/styles.css')
+
+
+class Client:
+    def __init__(self, host, port, rng, payment_ids):
+        self.host = host
+        self.port = port
+        self.rng = rng
+        self.payment_ids = payment_ids
+        self.conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if body is not None:
+            body = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                resp = self.conn.getresponse()
+                data = resp.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # Keep-alive connection closed by the server between requests
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+                continue
+            if resp.will_close:
+                self.conn.close()
+                self.conn = None
+            return resp.status, data
+
+    def static(self):
+        return self.request('GET', self.rng.choice(STATIC_PATHS), headers={'Accept-Encoding': 'gzip'})
+
+    def breathing(self):
+        return self.request('GET', self.rng.choice(BREATHING_PATHS), headers={'Accept-Encoding': 'gzip'})
+
+    def donate(self):
+        return self.request('POST', '/donate', {'amount': self.rng.randint(10, 1000), 'source': 'load-test'})
+
+    def payment(self):
+        status, data = self.request('POST', '/api/create-payment', {'amount': self.rng.randint(10, 1000)}, {'Idempotency-Key': str(uuid.uuid4())})
+        if status == 200:
+            self.payment_ids.append(json.loads(data)['payment_id'])
+        return status, data
+
+    def status(self):
+        payment_id = self.rng.choice(self.payment_ids) if self.payment_ids else str(uuid.uuid4())
+        return self.request('GET', f'/api/payment-status?payment_id={payment_id}')
+
+    def notify(self):
+        payment_id = self.rng.choice(self.payment_ids) if self.payment_ids else str(uuid.uuid4())
+        return self.request('POST', '/api/yookassa-notification', {
+            'type': 'notification',
+            'event': 'payment.succeeded',
+            'object': {'id': payment_id, 'status': 'succeeded', 'amount': {'value': '100.00', 'currency': 'RUB'}},
+        })
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if not hasattr(Client, name) or name in ('request',):
+            raise SystemExit(f'unknown route in --mix: {name}')
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def run_load(url, weights, duration, concurrency, seed):
+    target = urlsplit(url)
+    names = list(weights)
+    samples = {name: [] for name in names}
+    statuses = {name: {} for name in names}
+    payment_ids = []
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def worker(index):
+        rng = random.Random(seed + index)
+        client = Client(target.hostname, target.port or 80, rng, payment_ids)
+        own_samples = {name: [] for name in names}
+        own_statuses = {name: {} for name in names}
+        while time.perf_counter() < stop_at:
+            name = rng.choices(names, [weights[name] for name in names])[0]
+            began = time.perf_counter()
+            try:
+                status = getattr(client, name)()[0]
+            except Exception as e:
+                status = type(e).__name__
+            own_samples[name].append(time.perf_counter() - began)
+            own_statuses[name][status] = own_statuses[name].get(status, 0) + 1
+        with lock:
+            for name in names:
+                samples[name] += own_samples[name]
+                for status, count in own_statuses[name].items():
+                    statuses[name][status] = statuses[name].get(status, 0) + count
+
+    began = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+
+    routes = {}
+    for name in names:
+        if not samples[name]:
+            continue
+        routes[name] = dict(
+            requests=len(samples[name]),
+            per_second=round(len(samples[name]) / elapsed, 1),
+            statuses={str(status): count for status, count in sorted(statuses[name].items(), key=str)},
+            **timings(samples[name]),
+        )
+    total = sum(len(route_samples) for route_samples in samples.values())
+    all_samples = [sample for route_samples in samples.values() for sample in route_samples]
+    return {
+        'seconds': round(elapsed, 3),
+        'total': dict(requests=total, per_second=round(total / elapsed, 1), **(timings(all_samples) if all_samples else {})),
+        'routes': routes,
+    }
+
+
+# Gateway in this process against the mock API, with throwaway log and status files
+def start_local_gateway(args, workdir):
+    mock_server, mock = mock_yookassa.start(latency=args.upstream_latency, fail_every=args.upstream_fail_every)
+    os.environ['YOOKASSA_BASE_URL'] = f'http://127.0.0.1:{mock_server.server_address[1]}/v3'
+    os.environ.setdefault('YOOKASSA_SHOP_ID', 'load-test')
+    os.environ.setdefault('YOOKASSA_SECRET_KEY', 'load-test')
+    os.environ['YOOKASSA_NOTIFY_ALLOW'] = '127.0.0.1/32'
+    os.environ['PAYMENTS_DB'] = os.path.join(workdir, 'payments.db')
+    if not args.real_limits:
+        # Measure the gateway rather than the per-client limits meant for real visitors
+        os.environ['DONATE_RATE_LIMIT'] = os.environ['PAYMENT_RATE_LIMIT'] = '1000000,1000000'
+    # gateway (and the modules under it) read their configuration at import time
+    import gateway
+    httpd = gateway.start('127.0.0.1', 0, log_file=os.path.join(workdir, 'donations.log'))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{httpd.server_address[1]}', mock
+
+
+def main():
+    parser = argparse.ArgumentParser(description='gateway.py load test')
+    parser.add_argument('--url', help='gateway to load (default: start one in-process with a mock YooKassa)')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='route weights, e.g. static=60,payment=5')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds')
+    parser.add_argument('--concurrency', type=int, default=32, help='keep-alive clients')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--upstream-latency', type=float, default=0.05, help='mock YooKassa latency per payment, seconds')
+    parser.add_argument('--upstream-fail-every', type=int, default=0, help='mock answers every Nth payment with 500')
+    parser.add_argument('--real-limits', action='store_true', help='keep the per-client rate limits')
+    parser.add_argument('--out', default='bench_gateway_results.json')
+    args = parser.parse_args()
+
+    weights = parse_mix(args.mix)
+    mock = None
+    url = args.url
+    if not url:
+        url, mock = start_local_gateway(args, tempfile.mkdtemp(prefix='gateway-load-'))
+
+    print(f"loading {url} for {args.duration}s with {args.concurrency} clients...", file=sys.stderr)
+    results = run_load(url, weights, args.duration, args.concurrency, args.seed)
+    if mock is not None:
+        results['upstream'] = dict(mock.stats, connections=len(mock.connections))
+
+    report = {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'config': {key: value for key, value in vars(args).items() if key != 'out'},
+        'results': results,
+    }
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# Local stand-in for the YooKassa payments API (POST /v3/payments) with
+# configurable latency and injected 500s. Honours Idempotence-Key like the real
+# API: a repeated key returns the payment created for it.
+#
+#   python bench/mock_yookassa.py --port 9901 --latency 0.1
+#   YOOKASSA_BASE_URL=http://127.0.0.1:9901/v3 python gateway.py
+import argparse
+import itertools
+import json
+import threading
+import time
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class MockYooKassa:
+    def __init__(self, latency=0.0, fail_every=0):
+        self.latency = latency
+        self.fail_every = fail_every
+        self.lock = threading.Lock()
+        self.calls = itertools.count(1)
+        self.by_key = {}
+        self.connections = set()
+        self.stats = {'payments': 0, 'repeated_keys': 0, 'failures': 0}
+
+    def create_payment(self, key, request):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fail_every and next(self.calls) % self.fail_every == 0:
+            with self.lock:
+                self.stats['failures'] += 1
+            return 500, {'type': 'error', 'code': 'internal_server_error', 'description': 'injected failure'}
+        with self.lock:
+            payment = self.by_key.get(key)
+            if payment is not None:
+                self.stats['repeated_keys'] += 1
+                return 200, payment
+            payment_id = str(uuid.uuid4())
+            payment = {
+                'id': payment_id,
+                'status': 'pending',
+                'paid': False,
+                'amount': request.get('amount') or {'value': '0.00', 'currency': 'RUB'},
+                'confirmation': {'type': 'redirect', 'confirmation_url': f'https://yoomoney.example/checkout/payments/v2/contract?orderId={payment_id}'},
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime()),
+                'description': request.get('description'),
+            }
+            if key:
+                self.by_key[key] = payment
+            self.stats['payments'] += 1
+        return 200, payment
+
+
+def make_handler(api):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def _reply(self, status, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/stats':
+                with api.lock:
+                    self._reply(200, dict(api.stats, connections=len(api.connections)))
+            else:
+                self._reply(404, {'type': 'error', 'code': 'not_found'})
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length)
+            with api.lock:
+                api.connections.add(self.client_address)
+            if self.path.rstrip('/') != '/v3/payments':
+                self._reply(404, {'type': 'error', 'code': 'not_found'})
+                return
+            if not self.headers.get('Authorization', '').startswith('Basic '):
+                self._reply(401, {'type': 'error', 'code': 'invalid_credentials'})
+                return
+            try:
+                request = json.loads(body.decode('utf-8') or '{}')
+            except ValueError:
+                self._reply(400, {'type': 'error', 'code': 'invalid_request'})
+                return
+            self._reply(*api.create_payment(self.headers.get('Idempotence-Key'), request))
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+# Start the mock in a background thread; returns (server, api)
+def start(port=0, latency=0.0, fail_every=0):
+    api = MockYooKassa(latency, fail_every)
+    server = MockServer(('127.0.0.1', port), make_handler(api))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, api
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock YooKassa payments API')
+    parser.add_argument('--port', type=int, default=9901)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every payment')
+    parser.add_argument('--fail-every', type=int, default=0, help='answer every Nth payment with 500')
+    args = parser.parse_args()
+    server, api = start(args.port, args.latency, args.fail_every)
+    print(f"Mock YooKassa on http://127.0.0.1:{server.server_address[1]}/v3 (stats: /stats)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+
+
+if __name__ == '__main__':
+    main()
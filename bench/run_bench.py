@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# Reproducible benchmarks for sroki.py against a local fake Bot API.
+# Results are written as JSON so runs can be compared over time.
+#
+#   python bench/run_bench.py --rows 10000 --out bench_results.json
+#   python bench/run_bench.py --scenario dispatch --scenario list --telegram-limits
+import argparse
+import datetime
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_bot_api
+
+SCENARIOS = ('dispatch', 'list', 'import', 'discount')
+
+# Database created for this run; reset() refuses to empty any other file
+bench_db = None
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))]
+
+
+def timings(samples):
+    return {
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        'mean_ms': round(statistics.mean(samples) * 1000, 3),
+    }
+
+
+def reset(sroki):
+    if bench_db is None or os.path.abspath(sroki.storage.DB_PATH) != bench_db:
+        raise SystemExit(f"refusing to empty {sroki.storage.DB_PATH}: not the benchmark database {bench_db}")
+    sroki.storage.execute('''DELETE FROM reminders''')
+    with sroki.discount_lock:
+        sroki.discount_window.clear()
+
+
+def count(sroki):
+    return sroki.storage.query('''SELECT COUNT(*) FROM reminders''')[0][0]
+
+
+# Every row already due: time until the last one is confirmed
+def bench_dispatch(sroki, api, args):
+    reset(sroki)
+    gen_reminders.fill(sroki.storage.DB_PATH, args.rows, int(time.time()) - 86400, 1)
+    sent_before = dict(api.stats)
+    began = time.perf_counter()
+    sroki.dispatch_due_reminders()
+    while count(sroki):
+        if time.perf_counter() - began > args.timeout:
+            break
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - began
+    left = count(sroki)
+    return {
+        'rows': args.rows,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round((args.rows - left) / elapsed, 1),
+        'undelivered': left,
+        'messages': api.stats['sendMessage'] - sent_before['sendMessage'],
+        'too_many_requests': api.stats['too_many_requests'] - sent_before['too_many_requests'],
+    }
+
+
+# First page and pages deep into the table, following the keyset cursor
+def bench_list(sroki, api, args):
+    reset(sroki)
+    gen_reminders.fill(sroki.storage.DB_PATH, args.rows, int(time.time()) + 86400, 365)
+    conn = sqlite3.connect(sroki.storage.DB_PATH)
+    results = {'rows': args.rows}
+    for label, offset in (('first_page', None), ('middle_page', args.rows // 2), ('last_page', max(0, args.rows - sroki.PAGE_SIZE - 1))):
+        after = None
+        if offset is not None:
+            after = conn.execute('''SELECT reminder_date, id FROM reminders ORDER BY reminder_date, id LIMIT 1 OFFSET ?''', (offset,)).fetchone()
+        samples = []
+        for _ in range(args.repeat):
+            began = time.perf_counter()
+            sroki.list_all_reminders(after=after)
+            samples.append(time.perf_counter() - began)
+        results[label] = timings(samples)
+    conn.close()
+    return results
+
+
+def bench_import(sroki, api, args):
+    reset(sroki)
+    day = datetime.date.today() + datetime.timedelta(days=30)
+    lines = [f'Товар {i} / {day:%d.%m.%Y}' for i in range(args.rows)]
+    began = time.perf_counter()
+    added, errors = sroki.import_reminders(-1, lines)
+    elapsed = time.perf_counter() - began
+    return {'rows': args.rows, 'added': added, 'errors': len(errors), 'seconds': round(elapsed, 3), 'rows_per_second': round(added / elapsed, 1)}
+
+
+# Full sweep over a fresh window, then an incremental sweep with nothing new
+def bench_discount(sroki, api, args):
+    reset(sroki)
+    gen_reminders.fill(sroki.storage.DB_PATH, args.rows, int(time.time()) + 60, 60)
+    in_window = sroki.storage.query('''SELECT COUNT(*) FROM reminders WHERE reminder_date <= ?''', (int(time.time() + sroki.DISCOUNT_WINDOW.total_seconds()),))[0][0]
+    results = {'rows': args.rows, 'in_window': in_window}
+    for label in ('first_sweep', 'incremental_sweep'):
+        began = time.perf_counter()
+        sroki.send_two_week_reminders()
+        results[label] = {'seconds': round(time.perf_counter() - began, 4)}
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='sroki.py benchmarks')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=50, help='samples per latency measurement')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='run only these (repeatable)')
+    parser.add_argument('--latency', type=float, default=0.0, help='fake Bot API latency per call, seconds')
+    parser.add_argument('--fail-every', type=int, default=0, help='answer every Nth sendMessage with 429')
+    parser.add_argument('--telegram-limits', action='store_true', help="keep the send queue's real flood limits")
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--db', help='new database path, must not exist yet (default: a temporary file)')
+    parser.add_argument('--out', default='bench_results.json')
+    args = parser.parse_args()
+    if args.db and os.path.exists(args.db):
+        # Every scenario starts by deleting all reminders
+        parser.error(f'{args.db} already exists; the benchmark only runs on a database it creates')
+
+    global bench_db, gen_reminders
+    workdir = tempfile.mkdtemp(prefix='sroki-bench-')
+    server, api = fake_bot_api.start(latency=args.latency, fail_every=args.fail_every)
+
+    # storage (and so sroki and gen_reminders) reads its configuration at import time:
+    # nothing that imports it may be loaded before this
+    bench_db = os.path.abspath(args.db or os.path.join(workdir, 'reminders.db'))
+    os.environ['REMINDERS_DB'] = bench_db
+    os.environ['TELEGRAM_API_URL'] = f'http://127.0.0.1:{server.server_address[1]}/bot{{0}}/{{1}}'
+    os.environ['BOT_MODE'] = 'webhook'
+    import send_queue
+    if not args.telegram_limits:
+        # Measure the pipeline itself rather than Telegram's per-chat limit
+        send_queue.GLOBAL_RATE = send_queue.CHAT_RATE = send_queue.GROUP_RATE = 1e6
+        send_queue.CHAT_BURST = send_queue.GROUP_BURST = 1e6
+    import sroki
+    import gen_reminders
+
+    results = {}
+    for name in args.scenario or SCENARIOS:
+        print(f"running {name}...", file=sys.stderr)
+        results[name] = globals()[f'bench_{name}'](sroki, api, args)
+
+    report = {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'config': {key: value for key, value in vars(args).items() if key != 'out'},
+        'results': results,
+    }
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
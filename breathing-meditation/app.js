@@ -35,6 +35,21 @@ const YOOMONEY_TARGETS = 'Поддержать медитацию дыхания
 const YOOMONEY_LABEL = 'breathing-meditation';
 const API_URL = 'http://localhost:8787/api/create-payment';
 
+// One key per donation attempt: retrying the same amount after a failure reuses it,
+// so the gateway doesn't create a second payment
+let donationKey = null;
+let donationKeyAmount = null;
+
+function idempotencyKey(amount) {
+	if (!donationKey || donationKeyAmount !== amount) {
+		donationKey = window.crypto && crypto.randomUUID
+			? crypto.randomUUID()
+			: Date.now().toString(16) + '-' + Math.random().toString(16).slice(2);
+		donationKeyAmount = amount;
+	}
+	return donationKey;
+}
+
 function getCssVar(name, fallback) {
 	const v = getComputedStyle(document.documentElement).getPropertyValue(name).trim();
 	return v || fallback;
@@ -375,12 +390,13 @@ if (donateBtn) {
 		try {
 			const res = await fetch(API_URL, {
 				method: 'POST',
-				headers: { 'Content-Type': 'application/json' },
+				headers: { 'Content-Type': 'application/json', 'Idempotency-Key': idempotencyKey(amount) },
 				body: JSON.stringify({ amount })
 			});
 			const data = await res.json();
 			if (!res.ok) throw new Error(data && (data.error || data.details || 'Ошибка запроса'));
 			if (data && data.confirmation_url) {
+				donationKey = null;
 				window.location.href = data.confirmation_url;
 			} else {
 				throw new Error('Не получена ссылка на оплату');
@@ -0,0 +1,29 @@
+import json
+import time
+
+import storage
+
+# A half-finished dialog is forgotten after this many seconds of silence
+CONVERSATION_TTL = 3600
+
+
+# Remember the next wizard step for a chat, with the data collected so far.
+# Waits for the commit, so any process handling the chat's next message sees it.
+def set_step(chat_id, step, **data):
+    storage.execute('''INSERT OR REPLACE INTO conversations (chat_id, step, data, expires_at) VALUES (?, ?, ?, ?)''', (chat_id, step, json.dumps(data, ensure_ascii=False), int(time.time()) + CONVERSATION_TTL))
+
+
+# (step, data) for a chat, or None if there is no dialog or it has expired
+def get_step(chat_id):
+    rows = storage.query('''SELECT step, data FROM conversations WHERE chat_id = ? AND expires_at > ?''', (chat_id, int(time.time())))
+    if not rows:
+        return None
+    return rows[0][0], json.loads(rows[0][1])
+
+
+def clear(chat_id):
+    storage.execute('''DELETE FROM conversations WHERE chat_id = ?''', (chat_id,))
+
+
+def purge_expired():
+    storage.execute('''DELETE FROM conversations WHERE expires_at <= ?''', (int(time.time()),))
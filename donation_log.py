@@ -0,0 +1,164 @@
+import datetime
+import json
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+# Max entries written in one batch
+BATCH_MAX = 1000
+
+# The log is rotated when it grows past this size, and at the start of each day
+MAX_LOG_BYTES = 10 * 1024 * 1024
+
+# Sources are client-supplied; anything not looking like a short app name is counted as 'other'
+SOURCE_PATTERN = re.compile(r'^[a-z0-9][a-z0-9_-]{0,31}$')
+
+
+def clean_source(source) -> str:
+    source = str(source or '').strip().lower()
+    return source if SOURCE_PATTERN.match(source) else 'other'
+
+
+def _day(ts: float) -> str:
+    return datetime.date.fromtimestamp(ts).isoformat()
+
+
+# Append-only donation log with a single writer thread. Whatever was queued by
+# append() while the previous batch was being fsynced is written and fsynced
+# together (group commit), so an entry waits at most about two fsyncs; the
+# returned Future resolves once the entry is on disk.
+#
+# Running totals per day and per source are kept in memory and saved next to
+# the log (<log>.stats.json) with the log position they cover, so startup only
+# replays what was written after the last snapshot instead of the whole log.
+class DonationLog:
+    def __init__(self, path: str, max_bytes: int = MAX_LOG_BYTES):
+        self.path = path
+        self.stats_path = path + '.stats.json'
+        self.max_bytes = max_bytes
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.days = {}
+        self.sources = {}
+        self.file = None
+        self.file_day = None
+        self._open()
+        self._load_stats()
+        threading.Thread(target=self._writer_loop, daemon=True).start()
+
+    def append(self, entry: dict) -> Future:
+        future = Future()
+        self.queue.put((entry, future))
+        return future
+
+    def stats(self) -> dict:
+        with self.lock:
+            days = {day: dict(total) for day, total in sorted(self.days.items())}
+            sources = {source: dict(total) for source, total in sorted(self.sources.items())}
+        return {
+            'total': {
+                'count': sum(total['count'] for total in days.values()),
+                'amount': round(sum(total['amount'] for total in days.values()), 2),
+            },
+            'days': days,
+            'sources': sources,
+        }
+
+    def _open(self):
+        self.file = open(self.path, 'a', encoding='utf-8')
+        stat = os.fstat(self.file.fileno())
+        self.file_day = _day(stat.st_mtime if stat.st_size else time.time())
+
+    def _rotate(self):
+        self.file.close()
+        rotated = f'{self.path}.{time.strftime("%Y%m%d-%H%M%S")}'
+        suffix = 1
+        while os.path.exists(rotated if suffix == 1 else f'{rotated}.{suffix}'):
+            suffix += 1
+        os.replace(self.path, rotated if suffix == 1 else f'{rotated}.{suffix}')
+        self._open()
+
+    def _count(self, entry: dict):
+        amount = float(entry.get('amount', 0))
+        for totals, key in ((self.days, _day(entry.get('ts', 0))), (self.sources, clean_source(entry.get('source')))):
+            total = totals.setdefault(key, {'count': 0, 'amount': 0.0})
+            total['count'] += 1
+            total['amount'] = round(total['amount'] + amount, 2)
+
+    # Restore totals from the snapshot, then count entries the snapshot doesn't cover
+    def _load_stats(self):
+        offset = 0
+        try:
+            with open(self.stats_path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+            self.days = snapshot['days']
+            self.sources = snapshot['sources']
+            # A different inode means the log was rotated after the snapshot: replay the new file whole
+            if snapshot.get('inode') == os.fstat(self.file.fileno()).st_ino:
+                offset = snapshot['offset']
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"An error occurred: {e}")
+
+        line = b'\n'
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    self._count(json.loads(line))
+                except Exception:
+                    # Torn last line after a crash, or garbage
+                    continue
+        # Don't glue the next entry onto a torn line
+        if not line.endswith(b'\n'):
+            self.file.write('\n')
+            self.file.flush()
+
+    def _save_stats(self):
+        with self.lock:
+            snapshot = {
+                'inode': os.fstat(self.file.fileno()).st_ino,
+                'offset': self.file.tell(),
+                'days': self.days,
+                'sources': self.sources,
+            }
+            data = json.dumps(snapshot, ensure_ascii=False)
+        tmp_path = self.stats_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, self.stats_path)
+
+    def _writer_loop(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < BATCH_MAX:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                if self.file.tell() and (self.file_day != _day(time.time()) or self.file.tell() >= self.max_bytes):
+                    self._rotate()
+                self.file.write(''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry, _ in batch))
+                self.file.flush()
+                os.fsync(self.file.fileno())
+            except Exception as e:
+                print(f"An error occurred: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            with self.lock:
+                for entry, _ in batch:
+                    self._count(entry)
+            try:
+                self._save_stats()
+            except Exception as e:
+                print(f"An error occurred: {e}")
+            for _, future in batch:
+                future.set_result(None)
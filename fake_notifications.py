@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# Local stand-in for YooKassa HTTP notifications: POSTs payment events to the gateway.
+#
+#   YOOKASSA_NOTIFY_ALLOW=127.0.0.1/32 python yookassa_server.py
+#   python fake_notifications.py --payment-id 2d1f... --event payment.succeeded
+#   python fake_notifications.py --payments 1000 --concurrency 16
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+EVENT_STATUS = {
+    'payment.waiting_for_capture': 'waiting_for_capture',
+    'payment.succeeded': 'succeeded',
+    'payment.canceled': 'canceled',
+}
+
+
+def make_notification(payment_id, event, amount='100.00'):
+    return {
+        'type': 'notification',
+        'event': event,
+        'object': {
+            'id': payment_id,
+            'status': EVENT_STATUS[event],
+            'paid': event == 'payment.succeeded',
+            'amount': {'value': amount, 'currency': 'RUB'},
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime()),
+        },
+    }
+
+
+def post(url, notification):
+    req = urllib.request.Request(url, data=json.dumps(notification).encode('utf-8'), headers={'Content-Type': 'application/json'}, method='POST')
+    try:
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            return resp.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def main():
+    parser = argparse.ArgumentParser(description='POST fake YooKassa notifications to the payment gateway')
+    parser.add_argument('--url', default='http://localhost:8787/api/yookassa-notification')
+    parser.add_argument('--payment-id', action='append', help='payment to notify about (repeatable); default: random ids')
+    parser.add_argument('--payments', type=int, default=1, help='random payments to generate without --payment-id')
+    parser.add_argument('--event', default='payment.succeeded', choices=sorted(EVENT_STATUS))
+    parser.add_argument('--amount', default='100.00')
+    parser.add_argument('--concurrency', type=int, default=4)
+    args = parser.parse_args()
+
+    payment_ids = args.payment_id or [str(uuid.uuid4()) for _ in range(args.payments)]
+    statuses = {}
+    lock = threading.Lock()
+
+    def sender(chunk):
+        for payment_id in chunk:
+            status = post(args.url, make_notification(payment_id, args.event, args.amount))
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=sender, args=(payment_ids[i::args.concurrency],)) for i in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({'notifications': len(payment_ids), 'seconds': round(elapsed, 3), 'per_second': round(len(payment_ids) / elapsed, 1), 'statuses': statuses}))
+
+
+if __name__ == '__main__':
+    main()
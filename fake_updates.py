@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# Local stand-in for Telegram: POSTs fake updates to the bot's webhook endpoint.
+#
+#   BOT_MODE=webhook python sroki.py
+#   python fake_updates.py --url http://localhost:8443/webhook --chats 50 --updates 1000
+import argparse
+import itertools
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+_update_ids = itertools.count(1)
+
+
+def make_update(chat_id, text):
+    update_id = next(_update_ids)
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private', 'first_name': 'Test'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Test'},
+            'text': text,
+        },
+    }
+
+
+def post(url, update, secret=''):
+    headers = {'Content-Type': 'application/json'}
+    if secret:
+        headers['X-Telegram-Bot-Api-Secret-Token'] = secret
+    req = urllib.request.Request(url, data=json.dumps(update).encode('utf-8'), headers=headers, method='POST')
+    try:
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            return resp.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def main():
+    parser = argparse.ArgumentParser(description='POST fake Telegram updates to a webhook endpoint')
+    parser.add_argument('--url', default='http://localhost:8443/webhook')
+    parser.add_argument('--secret', default='')
+    parser.add_argument('--chats', type=int, default=10)
+    parser.add_argument('--updates', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--text', default='/start')
+    args = parser.parse_args()
+
+    updates = [make_update(1000 + i % args.chats, args.text) for i in range(args.updates)]
+    statuses = {}
+    lock = threading.Lock()
+
+    def sender(chunk):
+        for update in chunk:
+            status = post(args.url, update, args.secret)
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=sender, args=(updates[i::args.concurrency],)) for i in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({'updates': args.updates, 'seconds': round(elapsed, 3), 'per_second': round(args.updates / elapsed, 1), 'statuses': statuses}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# One process for both frontends and the payment API, routed by ROUTES:
+#
+#   GET  /               3d-snake static files
+#   GET  /breathing/     breathing-meditation static files
+#   POST /donate         donation log (as in server.py), GET /donations/stats
+#   /api/...             YooKassa gateway (as in yookassa_server.py)
+#
+# Replaces running server.py, yookassa_server.py and breathing-meditation/server.py
+# side by side. Listens on 8787 by default, where both frontends send payments.
+import os
+import signal
+from urllib.parse import urlsplit
+
+import donation_log
+import server
+import static_cache
+import yookassa_server
+
+# URL prefix -> directory of static files and the frontend files served from it,
+# longest prefix first. Nothing else in those directories (entry points, logs,
+# databases) is reachable.
+STATIC_MOUNTS = (
+    ('/breathing/', os.path.join(server.BASE_DIR, 'breathing-meditation'), ('index.html', 'app.js', 'styles.css')),
+    ('/', server.STATIC_DIR, ('index.html', 'main.js', 'style.css')),
+)
+
+# Print every request (the standalone servers do; under load it mostly costs time)
+ACCESS_LOG = os.environ.get('ACCESS_LOG') == '1'
+
+
+# Route serving files of one directory under a URL prefix from an in-memory cache
+def static_route(prefix, directory, files):
+    cache = static_cache.StaticCache(directory, only=files)
+
+    def route(handler):
+        entry = cache.get('/' + handler.path[len(prefix):])
+        if entry is None:
+            handler._not_found()
+            return
+        static_cache.send_static(handler, entry, head=handler.command == 'HEAD')
+    return route
+
+
+# (method, path, route): a path ending in '/' matches as a prefix, anything else exactly.
+# Routes are the standalone servers' handler methods, run on a GatewayHandler.
+def build_routes():
+    routes = [
+        ('POST', '/donate', server.AppHandler.do_POST),
+        ('GET', '/donations/stats', server.AppHandler.do_GET),
+        ('POST', '/api/', yookassa_server.Handler.do_POST),
+        ('GET', '/api/', yookassa_server.Handler.do_GET),
+        ('OPTIONS', '/api/', yookassa_server.Handler.do_OPTIONS),
+    ]
+    for prefix, directory, files in STATIC_MOUNTS:
+        route = static_route(prefix, directory, files)
+        routes += [('GET', prefix, route), ('HEAD', prefix, route)]
+    return routes
+
+
+ROUTES = []
+
+
+# Both standalone handlers in one: keep-alive, connection tracking and /donate from
+# server.AppHandler; CORS, JSON replies and the payment routes from yookassa_server.Handler
+class GatewayHandler(yookassa_server.Handler, server.AppHandler):
+    def _dispatch(self):
+        path = urlsplit(self.path).path
+        # '/breathing' -> '/breathing/', so the page's relative links resolve
+        if self.command in ('GET', 'HEAD') and any(path + '/' == prefix for prefix, _, _ in STATIC_MOUNTS):
+            self.send_response(301)
+            self.send_header('Location', path + '/')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        for method, route_path, route in ROUTES:
+            if method != self.command:
+                continue
+            if path == route_path or path.rstrip('/') == route_path or route_path.endswith('/') and path.startswith(route_path):
+                route(self)
+                return
+        self._not_found()
+
+    # A request body (if any) is left unread, so the connection is closed after it
+    def _not_found(self):
+        if self.headers.get('Content-Length') or self.headers.get('Transfer-Encoding'):
+            self._send_json_and_close(404, {'error': 'not_found'})
+        else:
+            self._send_json(404, {'error': 'not_found'})
+
+    do_GET = _dispatch
+    do_HEAD = _dispatch
+    do_POST = _dispatch
+    do_OPTIONS = _dispatch
+
+    def log_request(self, code='-', size='-'):
+        if ACCESS_LOG:
+            super().log_request(code, size)
+
+
+# Build the routes, open the donation log and start serving; returns the server
+# (call serve_forever() on it, or run it in a thread as bench/load_gateway.py does)
+def start(host='0.0.0.0', port=8787, log_file=server.LOG_FILE):
+    ROUTES[:] = build_routes()
+    server.donations = donation_log.DonationLog(log_file)
+    return server.AppServer((host, port), GatewayHandler)
+
+
+def run():
+    port = int(os.environ.get('PORT', '8787'))
+    httpd = start(port=port)
+    print(f"Gateway on http://localhost:{port}: 3d-snake at /, breathing-meditation at /breathing/, payments at /api/")
+
+    def on_sigterm(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, on_sigterm)
+
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+        if not httpd.drain(server.SHUTDOWN_TIMEOUT):
+            print("Some connections did not finish in time")
+    finally:
+        httpd.server_close()
+
+
+if __name__ == '__main__':
+    run()
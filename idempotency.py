@@ -0,0 +1,64 @@
+import collections
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+# Responses remembered per key: YooKassa itself honours an Idempotence-Key for 24 hours
+CACHE_TTL = 24 * 3600
+CACHE_SIZE = 10000
+
+# Keys as YooKassa accepts them (it allows up to 64 characters)
+KEY_PATTERN = re.compile(r'^[A-Za-z0-9_.:-]{1,64}$')
+
+
+def valid_key(key: str) -> bool:
+    return bool(KEY_PATTERN.match(key))
+
+
+# Runs fn() once per key. Callers arriving while it runs wait for the same result
+# (single flight); later callers get it from a TTL-bounded LRU cache, if
+# cacheable(result) said it may be kept. Failed calls aren't cached, so a retry
+# goes through again.
+class IdempotentCalls:
+    def __init__(self, ttl: float = CACHE_TTL, max_entries: int = CACHE_SIZE, cacheable=lambda result: True):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.cacheable = cacheable
+        # key -> (expires_at, result), least recently used first
+        self.results = collections.OrderedDict()
+        self.inflight = {}
+        self.lock = threading.Lock()
+
+    def run(self, key, fn):
+        now = time.monotonic()
+        with self.lock:
+            cached = self.results.get(key)
+            if cached and cached[0] > now:
+                self.results.move_to_end(key)
+                return cached[1]
+            if cached:
+                del self.results[key]
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self.inflight[key] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except Exception as e:
+            with self.lock:
+                del self.inflight[key]
+            future.set_exception(e)
+            raise
+
+        with self.lock:
+            del self.inflight[key]
+            if self.cacheable(result):
+                self.results[key] = (time.monotonic() + self.ttl, result)
+                while len(self.results) > self.max_entries:
+                    self.results.popitem(last=False)
+        future.set_result(result)
+        return result
@@ -0,0 +1,69 @@
+import os
+import socket
+import threading
+import time
+import uuid
+
+import storage
+
+# A leader that stops renewing loses the lease after LEASE_TTL seconds;
+# replicas retry every HEARTBEAT_INTERVAL, so one of them takes over within seconds
+LEASE_TTL = 15
+HEARTBEAT_INTERVAL = 5
+
+
+# Lease stored in the leases table. Only the holder runs the scheduler sweeps;
+# every replica keeps serving chat handlers regardless.
+class LeaderLease:
+    def __init__(self, name, on_change=None, on_heartbeat=None):
+        self.name = name
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.on_change = on_change
+        self.on_heartbeat = on_heartbeat
+        self.leader = threading.Event()
+        # Local deadline of the lease we hold (time.monotonic()): a renewal stuck behind a
+        # busy database must not keep us leader after other replicas may take over
+        self.expires = 0.0
+        self.attempted = 0.0
+
+    def start(self):
+        threading.Thread(target=self._heartbeat_loop, daemon=True).start()
+
+    def is_leader(self):
+        return self.leader.is_set() and time.monotonic() < self.expires
+
+    # Block until this replica holds the lease
+    def wait(self, timeout=None):
+        return self.leader.wait(timeout)
+
+    # Take the lease if it is free or expired, renew it if we already hold it
+    def _acquire(self, conn):
+        self.attempted = time.monotonic()
+        now = time.time()
+        conn.execute('''INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+            WHERE leases.holder = excluded.holder OR leases.expires_at < ?''', (self.name, self.holder, now + LEASE_TTL, now))
+        return conn.execute('''SELECT holder FROM leases WHERE name = ?''', (self.name,)).fetchone()[0] == self.holder
+
+    def _heartbeat_loop(self):
+        while True:
+            try:
+                leader = storage.write(self._acquire).result()
+                if leader:
+                    self.expires = self.attempted + LEASE_TTL
+            except Exception as e:
+                # Can't tell whether the renewal went through, so step down
+                print(f"An error occurred: {e}")
+                leader = False
+
+            if leader != self.leader.is_set():
+                if leader:
+                    self.leader.set()
+                else:
+                    self.leader.clear()
+                print(f"Lease {self.name}: {'acquired' if leader else 'lost'} by {self.holder}")
+                if self.on_change:
+                    self.on_change(leader)
+            if leader and self.on_heartbeat:
+                self.on_heartbeat()
+            time.sleep(HEARTBEAT_INTERVAL)
@@ -0,0 +1,172 @@
+import collections
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# Histogram buckets in seconds, from sub-millisecond SQLite calls to hour-long scheduler lag
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 3600)
+
+_registry = []
+_lock = threading.Lock()
+
+
+def _label_str(names, values):
+    if not names:
+        return ''
+    pairs = ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"')) for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = collections.defaultdict(float)
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with _lock:
+            self.values[key] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with _lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f'{self.name}{_label_str(self.labels, key)} {value}')
+        return lines
+
+
+# Gauge read at scrape time from a callback, e.g. a queue's current depth
+class Gauge:
+    def __init__(self, name, help, read):
+        self.name = name
+        self.help = help
+        self.read = read
+        _registry.append(self)
+
+    def render(self):
+        try:
+            value = self.read()
+        except Exception:
+            return []
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge', f'{self.name} {value}']
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [bucket counts..., +Inf count, sum]
+        self.values = {}
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with _lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        names = self.labels + ('le',)
+        with _lock:
+            for key, series in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), series):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{_label_str(names, key + (bound,))} {cumulative}')
+                lines.append(f'{self.name}_sum{_label_str(self.labels, key)} {series[-1]}')
+                lines.append(f'{self.name}_count{_label_str(self.labels, key)} {cumulative}')
+        return lines
+
+
+def render():
+    lines = []
+    for metric in list(_registry):
+        lines += metric.render()
+    return '\n'.join(lines) + '\n'
+
+
+# Name of the function that called the caller, used as a per-call-site label
+def call_site(depth=2):
+    frame = sys._getframe(depth)
+    return frame.f_code.co_name
+
+
+# Sampling profiler: snapshots every thread's stack each `interval` seconds and
+# returns collapsed stacks ("frame;frame;frame count"), the input format of flamegraph tools
+def sample_stacks(seconds=5.0, interval=0.005):
+    own = threading.get_ident()
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    counts = collections.Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = [f'{entry.name} ({entry.filename.rsplit("/", 1)[-1]}:{entry.lineno})' for entry in traceback.extract_stack(frame)]
+            counts[';'.join([names.get(ident, str(ident))] + stack)] += 1
+        time.sleep(interval)
+    return '\n'.join(f'{stack} {count}' for stack, count in counts.most_common()) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/metrics':
+            self._reply(200, render(), 'text/plain; version=0.0.4; charset=utf-8')
+        elif url.path == '/debug/profile':
+            query = parse_qs(url.query)
+            try:
+                seconds = min(float(query.get('seconds', ['5'])[0]), 60.0)
+                interval = max(float(query.get('interval', ['0.005'])[0]), 0.001)
+            except ValueError:
+                self._reply(400, 'bad seconds/interval\n', 'text/plain; charset=utf-8')
+                return
+            self._reply(200, sample_stacks(seconds, interval), 'text/plain; charset=utf-8')
+        else:
+            self._reply(404, 'not found\n', 'text/plain; charset=utf-8')
+
+    def _reply(self, status, text, content_type):
+        body = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Serve /metrics and /debug/profile in a background thread. Binds to localhost by default:
+# the profile endpoint exposes code paths and shouldn't be reachable from outside.
+def start_server(port, host='127.0.0.1'):
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,96 @@
+import ipaddress
+import sqlite3
+import threading
+import time
+
+# Addresses YooKassa sends HTTP notifications from (https://yookassa.ru/developers/using-api/webhooks)
+YOOKASSA_NETWORKS = (
+    '185.71.76.0/27',
+    '185.71.77.0/27',
+    '77.75.153.0/25',
+    '77.75.156.11/32',
+    '77.75.156.35/32',
+    '77.75.154.128/25',
+    '2a02:5180::/32',
+)
+
+# Payment statuses by how far along they are; a late or repeated notification
+# never moves a payment back (e.g. 'pending' after 'succeeded'), and a final
+# status (rank 2) is never replaced by the other final one
+STATUS_RANK = {
+    'pending': 0,
+    'waiting_for_capture': 1,
+    'succeeded': 2,
+    'canceled': 2,
+}
+
+EVENT_STATUS = {
+    'payment.waiting_for_capture': 'waiting_for_capture',
+    'payment.succeeded': 'succeeded',
+    'payment.canceled': 'canceled',
+}
+
+
+class Allowlist:
+    def __init__(self, networks):
+        self.networks = [ipaddress.ip_network(network.strip()) for network in networks if network.strip()]
+
+    def __contains__(self, address: str) -> bool:
+        try:
+            address = ipaddress.ip_address(address)
+        except ValueError:
+            return False
+        return any(address in network for network in self.networks)
+
+
+# payment_id -> latest known status, in a small SQLite file (WAL, one row per payment)
+class PaymentStatusStore:
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute('''PRAGMA journal_mode = WAL''')
+        self.conn.execute('''PRAGMA synchronous = NORMAL''')
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS payments (
+            payment_id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            rank INTEGER NOT NULL,
+            amount TEXT,
+            currency TEXT,
+            updated_at INTEGER NOT NULL) WITHOUT ROWID''')
+        self.lock = threading.Lock()
+
+    # Store a status unless a later one is already known
+    def record(self, payment_id: str, status: str, amount: str | None = None, currency: str | None = None):
+        rank = STATUS_RANK.get(status, 0)
+        with self.lock:
+            self.conn.execute('''INSERT INTO payments (payment_id, status, rank, amount, currency, updated_at) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (payment_id) DO UPDATE SET
+                    status = excluded.status,
+                    rank = excluded.rank,
+                    amount = coalesce(excluded.amount, amount),
+                    currency = coalesce(excluded.currency, currency),
+                    updated_at = excluded.updated_at
+                WHERE excluded.rank > payments.rank OR excluded.status = payments.status''', (payment_id, status, rank, amount, currency, int(time.time())))
+
+    def get(self, payment_id: str):
+        with self.lock:
+            row = self.conn.execute('''SELECT status, amount, currency, updated_at FROM payments WHERE payment_id = ?''', (payment_id,)).fetchone()
+        if row is None:
+            return None
+        return {'payment_id': payment_id, 'status': row[0], 'amount': row[1], 'currency': row[2], 'updated_at': row[3]}
+
+    # Apply a YooKassa notification body; returns the payment id, None for events about
+    # other objects (refunds, payouts), which are not payments, or raises ValueError
+    def apply_notification(self, notification: dict) -> str | None:
+        event = notification.get('event')
+        if notification.get('type') != 'notification' or not isinstance(event, str):
+            raise ValueError(f'unsupported notification: {event}')
+        if event not in EVENT_STATUS:
+            return None
+        payment = notification.get('object') or {}
+        payment_id = payment.get('id')
+        status = payment.get('status') or EVENT_STATUS[event]
+        if not payment_id or status not in STATUS_RANK:
+            raise ValueError(f'unsupported notification: {event}')
+        amount = payment.get('amount') or {}
+        self.record(str(payment_id), status, amount.get('value'), amount.get('currency'))
+        return payment_id
@@ -0,0 +1,67 @@
+import collections
+import math
+import os
+import threading
+import time
+
+from send_queue import TokenBucket
+
+# Take the client address from X-Forwarded-For (only when running behind a trusted proxy)
+TRUST_FORWARDED_FOR = os.environ.get('TRUST_FORWARDED_FOR') == '1'
+
+
+# Address a request is limited by
+def client_ip(handler) -> str:
+    if TRUST_FORWARDED_FOR:
+        forwarded = handler.headers.get('X-Forwarded-For', '')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return handler.client_address[0]
+
+
+# Per-client token buckets: `rate` requests per second on average, bursts of up to `burst`.
+# Buckets are kept in least-recently-used order; one idle long enough to have refilled
+# completely is the same as a new bucket, so it's dropped from the front on the next call.
+class RateLimiter:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.idle_after = burst / rate
+        self.buckets = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    # 0 if the request may go ahead, otherwise seconds until the client may retry
+    def check(self, key: str) -> float:
+        now = time.monotonic()
+        with self.lock:
+            while self.buckets:
+                oldest = next(iter(self.buckets.values()))
+                if now - oldest.updated < self.idle_after:
+                    break
+                self.buckets.popitem(last=False)
+
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = TokenBucket(self.rate, self.burst)
+            else:
+                self.buckets.move_to_end(key)
+            wait = bucket.delay(now)
+            if wait:
+                return wait
+            bucket.take(now)
+            return 0.0
+
+
+# Retry-After header value: whole seconds, at least 1
+def retry_after_header(wait: float) -> str:
+    return str(max(1, math.ceil(wait)))
+
+
+# RateLimiter configured from an env var "rate,burst" (requests per second, burst size)
+def from_env(name: str, rate: float, burst: float) -> RateLimiter:
+    value = os.environ.get(name)
+    if value:
+        rate, _, burst = value.partition(',')
+        rate = float(rate)
+        burst = float(burst or max(1.0, rate))
+    return RateLimiter(rate, burst)
@@ -0,0 +1,173 @@
+import collections
+import heapq
+import itertools
+import threading
+import time
+
+# Telegram rejects longer messages
+MAX_MESSAGE_LENGTH = 4096
+
+# Telegram flood limits: ~30 messages/s per bot, ~1/s per private chat, 20/min per group
+GLOBAL_RATE = 30.0
+CHAT_RATE = 1.0
+CHAT_BURST = 3
+GROUP_RATE = 20 / 60
+GROUP_BURST = 3
+
+# Attempts for errors other than 429 before the message is given up
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF = 2.0
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        # Set from a 429 response: no sends before this moment
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Seconds to wait before a token is available (0 if one is available now)
+    def delay(self, now):
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+
+# retry_after from a Telegram 429 error, or None for any other error
+def retry_after(error):
+    if getattr(error, 'error_code', None) != 429:
+        return None
+    result = getattr(error, 'result_json', None) or {}
+    return float((result.get('parameters') or {}).get('retry_after', 1))
+
+
+def split_text(text):
+    return [text[i:i + MAX_MESSAGE_LENGTH] for i in range(0, len(text), MAX_MESSAGE_LENGTH)] or ['']
+
+
+# Outbound message queue. Texts queued for the same chat are packed into as few
+# messages as fit into MAX_MESSAGE_LENGTH and sent in order, one worker per chat at
+# a time, within the per-chat and global rate limits. on_done(ok) is called for
+# every queued text once it has been sent (True) or given up (False).
+class SendQueue:
+    def __init__(self, send, workers=4):
+        self.send = send
+        self.cond = threading.Condition()
+        self.pending = {}
+        # (ready_at, seq, chat_id) for chats that have pending texts and no busy worker
+        self.ready = []
+        self.scheduled = set()
+        self.seq = itertools.count()
+        self.buckets = {}
+        self.global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_RATE)
+        for _ in range(workers):
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    def put(self, chat_id, text, on_done=None):
+        with self.cond:
+            queue = self.pending.setdefault(chat_id, collections.deque())
+            parts = split_text(text)
+            for i, part in enumerate(parts):
+                # Only the last part reports back, once the whole text is out
+                queue.append([part, on_done if i == len(parts) - 1 else None, 0])
+            if chat_id not in self.scheduled:
+                self._schedule(chat_id, time.monotonic())
+
+    def depth(self):
+        with self.cond:
+            return sum(len(queue) for queue in self.pending.values())
+
+    def _bucket(self, chat_id):
+        bucket = self.buckets.get(chat_id)
+        if bucket is None:
+            if str(chat_id).startswith('-'):
+                bucket = TokenBucket(GROUP_RATE, GROUP_BURST)
+            else:
+                bucket = TokenBucket(CHAT_RATE, CHAT_BURST)
+            self.buckets[chat_id] = bucket
+        return bucket
+
+    def _schedule(self, chat_id, ready_at):
+        self.scheduled.add(chat_id)
+        heapq.heappush(self.ready, (ready_at, next(self.seq), chat_id))
+        self.cond.notify()
+
+    # Pop the texts that fit into one message
+    def _pack(self, queue):
+        items = [queue.popleft()]
+        length = len(items[0][0])
+        while queue and length + 1 + len(queue[0][0]) <= MAX_MESSAGE_LENGTH:
+            item = queue.popleft()
+            length += 1 + len(item[0])
+            items.append(item)
+        return items
+
+    def _next_batch(self):
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                if not self.ready:
+                    self.cond.wait()
+                    continue
+                ready_at, _, chat_id = self.ready[0]
+                if ready_at > now:
+                    self.cond.wait(ready_at - now)
+                    continue
+                heapq.heappop(self.ready)
+
+                bucket = self._bucket(chat_id)
+                wait = max(bucket.delay(now), self.global_bucket.delay(now))
+                if wait > 0:
+                    heapq.heappush(self.ready, (now + wait, next(self.seq), chat_id))
+                    continue
+                bucket.take(now)
+                self.global_bucket.take(now)
+                return chat_id, self._pack(self.pending[chat_id])
+
+    def _worker(self):
+        while True:
+            chat_id, items = self._next_batch()
+            done = items
+            ok = True
+            try:
+                self.send(chat_id, '\n'.join(item[0] for item in items))
+            except Exception as e:
+                delay = retry_after(e)
+                if delay is None:
+                    print(f"An error occurred: {e}")
+                    for item in items:
+                        item[2] += 1
+                    delay = RETRY_BACKOFF ** items[0][2]
+                # Failed texts go back to the head of the chat queue, except those out of attempts
+                done = [item for item in items if item[2] >= MAX_ATTEMPTS]
+                ok = False
+                with self.cond:
+                    self.pending[chat_id].extendleft(reversed([item for item in items if item[2] < MAX_ATTEMPTS]))
+                    self._bucket(chat_id).blocked_until = time.monotonic() + delay
+
+            for item in done:
+                if item[1] is not None:
+                    try:
+                        item[1](ok)
+                    except Exception as e:
+                        print(f"An error occurred: {e}")
+
+            with self.cond:
+                queue = self.pending[chat_id]
+                if queue:
+                    self._schedule(chat_id, time.monotonic())
+                else:
+                    del self.pending[chat_id]
+                    self.scheduled.discard(chat_id)
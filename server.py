@@ -1,25 +1,109 @@
 #!/usr/bin/env python3
 import json
 import os
+import signal
+import socket
+import threading
 import time
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+from http.server import HTTPServer, SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import donation_log
+import ratelimit
+import static_cache
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 STATIC_DIR = os.path.join(BASE_DIR, '3d-snake')
 LOG_FILE = os.path.join(BASE_DIR, 'donations.log')
 
+# 'threaded' serves every connection in its own thread; 'single' is the old one-at-a-time server
+SERVER_MODE = os.environ.get('SERVER_MODE', 'threaded')
+
+# Connections served at once; past this new clients get 503 instead of waiting behind the others
+MAX_CONNECTIONS = int(os.environ.get('MAX_CONNECTIONS', '256'))
+
+# Idle keep-alive connections are closed after this many seconds, freeing their slot
+KEEPALIVE_TIMEOUT = 15
+
+# On shutdown, how long to wait for requests in progress
+SHUTDOWN_TIMEOUT = 10
+
+# Donations from this frontend are counted under this source unless the request names one
+DONATION_SOURCE = '3d-snake'
+
+# How long /donate waits for its log entry to reach the disk
+DONATION_WRITE_TIMEOUT = 5
+
+# Per-client limits by route ("rate,burst" env vars: requests per second, burst size)
+RATE_LIMITS = {
+    '/donate': ratelimit.from_env('DONATE_RATE_LIMIT', 1.0, 10),
+}
+
+# Files of STATIC_DIR held in memory, filled in run(); anything not in it falls back to disk
+static_files = None
+
+# Donation log writer, opened in run()
+donations = None
+
 
 class AppHandler(SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEPALIVE_TIMEOUT
+    # Headers and body go out in separate writes; with Nagle on, a keep-alive
+    # client waits for a delayed ACK (~40 ms) on every response
+    disable_nagle_algorithm = True
+
     def __init__(self, *args, directory: str | None = STATIC_DIR, **kwargs):
         super().__init__(*args, directory=directory, **kwargs)
 
     def do_GET(self):
+        if urlsplit(self.path).path.rstrip('/') == '/donations/stats':
+            self._send_json(200, donations.stats())
+            return
+        entry = static_files.get(self.path) if static_files else None
+        if entry:
+            static_cache.send_static(self, entry)
+            return
         if self.path == '/':
             self.path = '/index.html'
         return super().do_GET()
 
+    def do_HEAD(self):
+        entry = static_files.get(self.path) if static_files else None
+        if entry:
+            static_cache.send_static(self, entry, head=True)
+            return
+        return super().do_HEAD()
+
+    # Between requests a keep-alive connection is idle; AppServer.drain() closes idle ones
+    def handle_one_request(self):
+        if isinstance(self.server, AppServer):
+            self.server.set_idle(self.connection, True)
+        super().handle_one_request()
+        # While shutting down, finish the current request but don't wait for another
+        if getattr(self.server, 'stopping', False):
+            self.close_connection = True
+
+    def parse_request(self):
+        if isinstance(self.server, AppServer):
+            self.server.set_idle(self.connection, False)
+        return super().parse_request()
+
+    # False (with a 429 sent) if the client is over the route's limit
+    def _within_limit(self, route: str) -> bool:
+        limiter = RATE_LIMITS.get(route)
+        wait = limiter.check(ratelimit.client_ip(self)) if limiter else 0
+        if not wait:
+            return True
+        # The body is left unread, so the connection can't be reused
+        self.close_connection = True
+        self._send_json(429, {"ok": False, "error": "rate_limited"}, {'Retry-After': ratelimit.retry_after_header(wait), 'Connection': 'close'})
+        return False
+
     def do_POST(self):
-        if self.path.rstrip('/') == '/donate':
+        if urlsplit(self.path).path.rstrip('/') == '/donate':
+            if not self._within_limit('/donate'):
+                return
             length = int(self.headers.get('Content-Length', '0') or '0')
             body = self.rfile.read(length) if length > 0 else b''
             try:
@@ -36,24 +120,28 @@ class AppHandler(SimpleHTTPRequestHandler):
             entry = {
                 'ts': int(time.time()),
                 'amount': amount,
-                'ip': self.client_address[0],
+                'ip': ratelimit.client_ip(self),
+                'source': donation_log.clean_source(data.get('source') or DONATION_SOURCE),
             }
             try:
-                with open(LOG_FILE, 'a', encoding='utf-8') as f:
-                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
-            except Exception:
-                pass
+                donations.append(entry).result(timeout=DONATION_WRITE_TIMEOUT)
+            except Exception as e:
+                print(f"An error occurred: {e}")
+                self._send_json(500, {"ok": False, "error": "log_unavailable"})
+                return
 
             self._send_json(200, {"ok": True})
             return
 
         return super().do_POST()
 
-    def _send_json(self, status: int, payload: dict):
+    def _send_json(self, status: int, payload: dict, headers: dict | None = None):
         body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
         self.send_response(status)
         self.send_header('Content-Type', 'application/json; charset=utf-8')
         self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
         self.end_headers()
         self.wfile.write(body)
 
@@ -62,16 +150,95 @@ class AppHandler(SimpleHTTPRequestHandler):
         print("%s - - [%s] %s" % (self.client_address[0], self.log_date_time_string(), format % args))
 
 
+class AppServer(ThreadingHTTPServer):
+    # Listen backlog; the default of 5 overflows when many players connect at once
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class, max_connections: int = MAX_CONNECTIONS):
+        super().__init__(server_address, handler_class)
+        self.max_connections = max_connections
+        self.slots = threading.BoundedSemaphore(max_connections)
+        self.stopping = False
+        self.idle = set()
+        self.idle_lock = threading.Lock()
+
+    def set_idle(self, connection, idle: bool):
+        with self.idle_lock:
+            if idle:
+                self.idle.add(connection)
+            else:
+                self.idle.discard(connection)
+
+    def process_request(self, request, client_address):
+        if not self.slots.acquire(blocking=False):
+            try:
+                request.sendall(b'HTTP/1.1 503 Service Unavailable\r\nRetry-After: 1\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self.set_idle(request, False)
+            self.slots.release()
+
+    # Wait until every connection has finished (or the timeout passes); True if all did
+    def drain(self, timeout: float) -> bool:
+        self.stopping = True
+        # Wake connections waiting for their next request; they see EOF and close
+        with self.idle_lock:
+            for connection in self.idle:
+                try:
+                    connection.shutdown(socket.SHUT_RD)
+                except OSError:
+                    pass
+        deadline = time.monotonic() + timeout
+        taken = 0
+        while taken < self.max_connections:
+            if not self.slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                break
+            taken += 1
+        for _ in range(taken):
+            self.slots.release()
+        return taken == self.max_connections
+
+
 def run():
+    global static_files, donations
     port = int(os.environ.get('PORT', '8000'))
+    static_files = static_cache.StaticCache(STATIC_DIR)
+    donations = donation_log.DonationLog(LOG_FILE)
     server_address = ('0.0.0.0', port)
-    httpd = HTTPServer(server_address, AppHandler)
-    print(f"Serving 3d-snake from {STATIC_DIR} at http://localhost:{port}")
-    print("POST /donate with JSON {amount: number}")
+    if SERVER_MODE == 'single':
+        # One connection at a time, so don't let a client keep it open
+        AppHandler.protocol_version = 'HTTP/1.0'
+        httpd = HTTPServer(server_address, AppHandler)
+    else:
+        httpd = AppServer(server_address, AppHandler)
+    print(f"Serving 3d-snake from {STATIC_DIR} at http://localhost:{port} ({SERVER_MODE})")
+    print("POST /donate with JSON {amount: number}, GET /donations/stats for totals")
+
+    # SIGTERM (docker stop, systemd) shuts down the same way as Ctrl+C
+    def on_sigterm(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, on_sigterm)
+
     try:
         httpd.serve_forever()
     except KeyboardInterrupt:
         print("\nShutting down...")
+        if isinstance(httpd, AppServer) and not httpd.drain(SHUTDOWN_TIMEOUT):
+            print("Some connections did not finish in time")
+    finally:
+        httpd.server_close()
 
 
 if __name__ == '__main__':
@@ -1,59 +1,281 @@
 import telebot
-import sqlite3
+import functools
+import os
 import threading
+import heapq
+import io
+import re
 import time
 import datetime
 import schedule
 from dateutil.relativedelta import relativedelta
+from send_queue import SendQueue
+import storage
+import archive
+import conversation
+import leader
+import metrics
+import webhook
+
+# Режим получения обновлений: polling (по умолчанию) или webhook
+BOT_MODE = os.environ.get('BOT_MODE', 'polling')
+
+# Настройки webhook-режима. Без WEBHOOK_URL вебхук у Telegram не регистрируется
+# (например, когда обновления шлет локальная заглушка)
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL', '')
+WEBHOOK_PATH = os.environ.get('WEBHOOK_PATH', '/webhook')
+WEBHOOK_PORT = int(os.environ.get('WEBHOOK_PORT', '8443'))
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET', '')
+WEBHOOK_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', '8'))
+
+# Адрес Bot API можно подменить локальной заглушкой, вид: http://host:port/bot{0}/{1}
+if os.environ.get('TELEGRAM_API_URL'):
+    telebot.apihelper.API_URL = os.environ['TELEGRAM_API_URL']
+
+# Порт для /metrics и /debug/profile на localhost; 0 - не запускать
+METRICS_PORT = int(os.environ.get('METRICS_PORT', '0'))
+
+SEND_SECONDS = metrics.Histogram('telegram_send_seconds', 'bot.send_message latency')
+SEND_ERRORS = metrics.Counter('telegram_send_errors_total', 'Failed bot.send_message calls', labels=('code',))
+DISPATCH_LAG = metrics.Histogram('reminder_dispatch_lag_seconds', 'Delay between reminder_date and the actual send')
+HANDLER_SECONDS = metrics.Histogram('handler_seconds', 'Handler duration per callback_data or conversation step', labels=('handler',))
+
+
+# TeleBot, который замеряет время и ошибки send_message
+class InstrumentedTeleBot(telebot.TeleBot):
+    def send_message(self, *args, **kwargs):
+        try:
+            with SEND_SECONDS.time():
+                return super().send_message(*args, **kwargs)
+        except Exception as e:
+            SEND_ERRORS.inc(code=getattr(e, 'error_code', type(e).__name__))
+            raise
+
+
+# Создаем бота. В webhook-режиме обработчики вызываются из пула webhook.py,
+# который сам сохраняет порядок внутри чата, поэтому собственный пул telebot не нужен
+bot = InstrumentedTeleBot('7152650009:AAHE0rV47EhgbwfxrP0ZS8bEis6j8OLumQk', threaded=BOT_MODE != 'webhook')
 
+chatid = '-1002026044298'
 
-# Создаем бота
-bot = telebot.TeleBot('7152650009:AAHE0rV47EhgbwfxrP0ZS8bEis6j8OLumQk')
+# Исходящие сообщения в chatid идут через очередь с учетом лимитов Telegram
+outbox = SendQueue(lambda chat_id, text: bot.send_message(chat_id, text))
+metrics.Gauge('send_queue_depth', 'Texts waiting in the outbound send queue', outbox.depth)
+
+# Reminder dates are stored as epoch seconds (local midnight of the due day)
+def to_epoch(date):
+    return int(date.timestamp())
+
+
+def format_date(ts):
+    return datetime.datetime.fromtimestamp(ts).strftime('%Y-%m-%d')
+
+
+# Единицы интервала: как их выбирает пользователь -> как они хранятся в repeat_unit
+UNITS = {'дни': 'days', 'недели': 'weeks', 'месяцы': 'months'}
 
-chatid = '-1002026044298'
 
-# Create the database connection
-conn = sqlite3.connect('reminders.db')
-c = conn.cursor()
-c.execute('''CREATE TABLE IF NOT EXISTS reminders (chat_id INTEGER, reminder_text TEXT, reminder_date DATETIME, reminder_type TEXT)''')
-conn.commit()
-conn.close()  # Close the connection after setup
+def add_interval(date, unit, quantity):
+    if unit == 'days':
+        return date + datetime.timedelta(days=quantity)
+    if unit == 'weeks':
+        return date + datetime.timedelta(weeks=quantity)
+    return date + relativedelta(months=quantity)
+
+
+# Next occurrence of a recurring reminder after now. Counted from the fired date,
+# so a missed stretch (bot was down) yields one reminder, not one per skipped period,
+# and months don't drift (31.01 -> 28.02 -> 31.03). None for a broken rule (every <= 0),
+# which would never get past now; such a reminder fires once and is removed.
+def next_occurrence(reminder_date, unit, every, now):
+    if not every or every <= 0:
+        return None
+    date = datetime.datetime.fromtimestamp(reminder_date)
+    count = 1
+    while to_epoch(add_interval(date, unit, every * count)) <= now:
+        count += 1
+    return to_epoch(add_interval(date, unit, every * count))
+
+
+# Create or upgrade the database before anything touches it
+storage.init()
+
+# Due times of pending reminders (epoch seconds), earliest on top.
+# The scheduler sleeps until due_heap[0] and is woken up by schedule_due()
+# whenever a new reminder lands before the current head.
+due_heap = []
+due_cond = threading.Condition()
+
+# Upper bound for a single sleep, so wall-clock jumps (NTP, DST) can't stall the scheduler
+MAX_SCHEDULER_SLEEP = 3600
+
+# Delay before retrying a failed check
+RETRY_DELAY = 60
+
+# How many due reminders one dispatcher claims per transaction
+DISPATCH_BATCH = 500
+
+# How long a claim is held before another dispatcher may take the rows over.
+# Covers the time a batch may wait in the rate-limited send queue.
+CLAIM_TTL = 3600
+
+
+def schedule_due(reminder_date):
+    ts = reminder_date.timestamp()
+    with due_cond:
+        heapq.heappush(due_heap, ts)
+        if due_heap[0] == ts:
+            due_cond.notify()
+
+
+def load_due_heap():
+    # Only the distinct due dates are needed, which the date index covers.
+    # Claims left over by a dead dispatcher become due again when they expire.
+    due = [row[0] for row in storage.query('''SELECT DISTINCT reminder_date FROM reminders''')]
+    due += [row[0] for row in storage.query('''SELECT DISTINCT claimed_until FROM reminders WHERE claimed_until IS NOT NULL''')]
+
+    heapq.heapify(due)
+    with due_cond:
+        due_heap[:] = due
+        due_cond.notify()
+
+
+# Take a batch of due, unclaimed reminders in one transaction and mark them in-flight.
+# Writes are serialized (one writer thread, BEGIN IMMEDIATE across processes),
+# so a row is only ever claimed once.
+def claim_due_reminders(now):
+    def claim(conn):
+        reminders = conn.execute('''SELECT id, reminder_text, reminder_date FROM reminders WHERE reminder_date <= ? AND (claimed_until IS NULL OR claimed_until <= ?) ORDER BY reminder_date LIMIT ?''', (now, now, DISPATCH_BATCH)).fetchall()
+        conn.executemany('''UPDATE reminders SET claimed_until = ? WHERE id = ?''', [(now + CLAIM_TTL, reminder[0]) for reminder in reminders])
+        return reminders
+    return storage.write(claim).result()
+
+
+# Confirm sent reminders and release failed ones (unclaim) in one transaction.
+# One-time reminders are deleted; recurring ones move to their next occurrence in place.
+def finish_claimed(sent_ids, failed_ids):
+    now = int(time.time())
+
+    def finish(conn):
+        rescheduled = []
+        # Сработавшие напоминания переносим в архив (для повторяющихся - копию этого срока)
+        archive.archive_fired(conn, sent_ids, now)
+        if sent_ids:
+            recurring = conn.execute(f'''SELECT id, reminder_date, repeat_unit, repeat_every, repeat_until FROM reminders WHERE id IN ({','.join('?' * len(sent_ids))}) AND repeat_unit IS NOT NULL''', sent_ids).fetchall()
+            for reminder_id, reminder_date, repeat_unit, repeat_every, repeat_until in recurring:
+                next_date = next_occurrence(reminder_date, repeat_unit, repeat_every, now)
+                if next_date is not None and (repeat_until is None or next_date <= repeat_until):
+                    rescheduled.append((next_date, reminder_id))
+        conn.executemany('''UPDATE reminders SET reminder_date = ?, claimed_until = NULL, discount_notified = 0 WHERE id = ?''', rescheduled)
+        kept = {reminder_id for _, reminder_id in rescheduled}
+        conn.executemany('''DELETE FROM reminders WHERE id = ?''', [(reminder_id,) for reminder_id in sent_ids if reminder_id not in kept])
+        conn.executemany('''UPDATE reminders SET claimed_until = NULL WHERE id = ?''', [(reminder_id,) for reminder_id in failed_ids])
+        return {next_date for next_date, _ in rescheduled}
+
+    for next_date in storage.write(finish).result():
+        schedule_due(datetime.datetime.fromtimestamp(next_date))
+
+
+# Collects send results for a claimed batch and confirms/releases it once all are in
+class ClaimedBatch:
+    def __init__(self, reminder_ids):
+        self.lock = threading.Lock()
+        self.remaining = len(reminder_ids)
+        self.sent_ids = []
+        self.failed_ids = []
+
+    def on_done(self, reminder_id, reminder_date):
+        def callback(ok):
+            if ok:
+                DISPATCH_LAG.observe(time.time() - reminder_date)
+            with self.lock:
+                (self.sent_ids if ok else self.failed_ids).append(reminder_id)
+                self.remaining -= 1
+                if self.remaining:
+                    return
+            finish_claimed(self.sent_ids, self.failed_ids)
+            if self.failed_ids:
+                schedule_due(datetime.datetime.now() + datetime.timedelta(seconds=RETRY_DELAY))
+        return callback
+
+
+# Send every due reminder: claim a batch, queue it, then confirm/release it in bulk
+def dispatch_due_reminders():
+    now = int(time.time())
+    while True:
+        reminders = claim_due_reminders(now)
+        batch = ClaimedBatch([reminder[0] for reminder in reminders])
+        for reminder_id, reminder_text, reminder_date in reminders:
+            outbox.put(chatid, reminder_text, batch.on_done(reminder_id, reminder_date))
+        if len(reminders) < DISPATCH_BATCH:
+            return
+
 
 # Define the function to check reminders
 def check_reminders():
     try:
-        # Get the current time
-        now = datetime.datetime.now()
+        dispatch_due_reminders()
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        # The due entries were already popped from the heap, so try again later
+        schedule_due(datetime.datetime.now() + datetime.timedelta(seconds=RETRY_DELAY))
+
+# Pick up reminders added by other replicas: the earliest free due date and the
+# earliest expiring claim are cheap index lookups
+def refresh_next_due():
+    try:
+        rows = storage.query('''SELECT MIN(reminder_date) FROM reminders WHERE claimed_until IS NULL''')
+        rows += storage.query('''SELECT MIN(claimed_until) FROM reminders WHERE claimed_until IS NOT NULL''')
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return
+    for (ts,) in rows:
+        if ts is not None and (not due_heap or ts < due_heap[0]):
+            schedule_due(datetime.datetime.fromtimestamp(ts))
 
-        # Create a new database connection and cursor within the thread
-        conn = sqlite3.connect('reminders.db')
-        c = conn.cursor()
 
-        # Get all reminders that should be sent within the next 5 minutes
-        reminders = c.execute('''SELECT * FROM reminders WHERE reminder_date <= ?''', (now,)).fetchall()
+def on_leadership_change(is_leader):
+    # Wake the scheduler so it notices a lost lease right away
+    with due_cond:
+        due_cond.notify()
 
-        # Send reminders to users
-        for reminder in reminders:
-            bot.send_message(chatid, reminder[1])
-            # Delete the reminder from the database
-            c.execute('''DELETE FROM reminders WHERE chat_id = ? AND reminder_text = ? AND reminder_date = ?''', (reminder[0], reminder[1], reminder[2]))
-            conn.commit()
 
-        # Close the database connection
-        conn.close()
+# Only the holder of this lease runs the due-reminder and discount sweeps
+scheduler_lease = leader.LeaderLease('scheduler', on_change=on_leadership_change, on_heartbeat=refresh_next_due)
 
-    except Exception as e:
-        print(f"An error occurred: {e}")
 
-# Define the function to check reminders every 10 minutes
+# Wait until something on the heap is due and pop it; False if the lease was lost meanwhile
+def wait_for_due():
+    with due_cond:
+        while scheduler_lease.is_leader():
+            now = time.time()
+            if due_heap and due_heap[0] <= now:
+                while due_heap and due_heap[0] <= now:
+                    heapq.heappop(due_heap)
+                return True
+            timeout = MAX_SCHEDULER_SLEEP
+            if due_heap:
+                timeout = min(timeout, due_heap[0] - now)
+            due_cond.wait(timeout)
+    return False
+
+
+# Sleep until the earliest due reminder, then dispatch everything that is due
 def check_reminders_loop():
     while True:
-        check_reminders()
-        time.sleep(86400)  # 1 day
-
-# Start the thread for checking reminders every 10 minutes
+        # The heap is rebuilt from the database every time this replica takes over
+        scheduler_lease.wait()
+        try:
+            load_due_heap()
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            time.sleep(RETRY_DELAY)
+            continue
+        while wait_for_due():
+            check_reminders()
+
+# The scheduler thread, started in main()
 reminder_thread = threading.Thread(target=check_reminders_loop)
-reminder_thread.start()
 
 # Обработчик для получения текста напоминания
 def get_reminder_text(message):
@@ -62,8 +284,8 @@ def get_reminder_text(message):
 
     # Запрашиваем у пользователя дату начала напоминания
     bot.send_message(message.chat.id, 'Введите дату начала напоминания в формате дд.мм.гггг:')
-    # Регистрируем обработчик для получения даты начала напоминания
-    bot.register_next_step_handler(message, get_start_date, reminder_text)
+    # Запоминаем следующий шаг: получение даты начала напоминания
+    conversation.set_step(message.chat.id, 'get_start_date', reminder_text=reminder_text)
 
 # Функция для создания клавиатуры с выбором единиц (дни, месяцы, недели)
 def get_units_keyboard():
@@ -79,14 +301,14 @@ def get_start_date(message, reminder_text=None):
 
         # Запрашиваем у пользователя единицу (дни, месяцы или недели)
         bot.send_message(message.chat.id, 'Выберите единицу для напоминания:', reply_markup=get_units_keyboard())
-        # Регистрируем обработчик для получения единицы
-        bot.register_next_step_handler(message, get_units, reminder_text, start_date)
+        # Запоминаем следующий шаг: получение единицы
+        conversation.set_step(message.chat.id, 'get_units', reminder_text=reminder_text, start_date=to_epoch(start_date))
 
     except ValueError:
         # Если формат даты неправильный, просим пользователя ввести ее снова
         bot.send_message(message.chat.id, 'Неправильный формат даты. Пожалуйста, введите дату в формате дд.мм.гггг:')
-        # Регистрируем обработчик для получения правильного формата даты
-        bot.register_next_step_handler(message, get_start_date, reminder_text)
+        # Снова ждем дату начала напоминания
+        conversation.set_step(message.chat.id, 'get_start_date', reminder_text=reminder_text)
 
 # Функция для получения единицы (дни, месяцы или недели)
 def get_units(message, reminder_text=None, start_date=None):
@@ -96,59 +318,80 @@ def get_units(message, reminder_text=None, start_date=None):
 
         # Запрашиваем у пользователя количество выбранных единиц
         bot.send_message(message.chat.id, f'Введите количество {unit}:')
-        # Регистрируем обработчик для получения количества единиц
-        bot.register_next_step_handler(message, get_quantity, reminder_text, start_date, unit)
+        # Запоминаем следующий шаг: получение количества единиц
+        conversation.set_step(message.chat.id, 'get_quantity', reminder_text=reminder_text, start_date=start_date, unit=unit)
 
     except Exception as e:
         # Если произошла ошибка, сообщаем об этом пользователю
         print(f"An error occurred: {e}")
 
-# Функция для получения количества выбранных единиц
+# Функция для получения количества выбранных единиц (start_date - epoch-время)
 def get_quantity(message, reminder_text=None, start_date=None, unit=None):
     try:
         # Получаем количество выбранных единиц
         quantity = int(message.text)
+        if quantity <= 0:
+            # Нулевой или отрицательный интервал: просим ввести заново
+            raise ValueError(quantity)
 
         # Вычисляем дату напоминания на основе выбранных единиц и количества
-        if unit == 'дни':
-            reminder_date = start_date + datetime.timedelta(days=quantity)
-        elif unit == 'месяцы':
-            reminder_date = start_date + relativedelta(months=quantity)
-        elif unit == 'недели':
-            reminder_date = start_date + datetime.timedelta(weeks=quantity)
-        else:
+        if unit not in UNITS:
             # Если выбрана неизвестная единица, сообщаем пользователю об ошибке
             bot.send_message(message.chat.id, 'Неизвестная единица. Пожалуйста, выберите дни, месяцы или недели:')
             return
+        reminder_date = add_interval(datetime.datetime.fromtimestamp(start_date), UNITS[unit], quantity)
 
-        # Добавляем напоминание в базу данных
-        add_reminder_to_db(message, reminder_text, reminder_date)
+        # Спрашиваем, повторять ли напоминание с тем же интервалом
+        bot.send_message(message.chat.id, f'Повторять напоминание каждые {quantity} {unit}?', reply_markup=get_repeat_keyboard())
+        conversation.set_step(message.chat.id, 'get_repeat', reminder_text=reminder_text, reminder_date=to_epoch(reminder_date), unit=UNITS[unit], quantity=quantity)
 
     except ValueError:
         # Если введено неправильное количество единиц, просим пользователя ввести его снова
         bot.send_message(message.chat.id, f'Неправильный формат количества {unit}. Пожалуйста, введите число в числовом формате:')
-        # Регистрируем обработчик для получения правильного количества единиц
-        bot.register_next_step_handler(message, get_quantity, reminder_text, start_date, unit)
+        # Снова ждем количество единиц
+        conversation.set_step(message.chat.id, 'get_quantity', reminder_text=reminder_text, start_date=start_date, unit=unit)
+
+# Клавиатура для вопроса о повторе
+def get_repeat_keyboard():
+    keyboard = telebot.types.ReplyKeyboardMarkup(row_width=2, resize_keyboard=True)
+    keyboard.add(telebot.types.KeyboardButton('Да'), telebot.types.KeyboardButton('Нет'))
+    return keyboard
 
-# Функция для добавления напоминания в базу данных
-def add_reminder_to_db(message, reminder_text, reminder_date):
+# Функция для получения ответа, повторять ли напоминание
+def get_repeat(message, reminder_text=None, reminder_date=None, unit=None, quantity=None):
+    if (message.text or '').strip().lower() == 'да':
+        bot.send_message(message.chat.id, 'Введите дату окончания повторов в формате дд.мм.гггг или "нет", чтобы повторять без конца:')
+        conversation.set_step(message.chat.id, 'get_repeat_until', reminder_text=reminder_text, reminder_date=reminder_date, unit=unit, quantity=quantity)
+        return
+    add_reminder_to_db(message, reminder_text, datetime.datetime.fromtimestamp(reminder_date))
+
+# Функция для получения даты окончания повторов
+def get_repeat_until(message, reminder_text=None, reminder_date=None, unit=None, quantity=None):
+    text = (message.text or '').strip().lower()
+    try:
+        repeat_until = None if text == 'нет' else to_epoch(datetime.datetime.strptime(text, '%d.%m.%Y'))
+    except ValueError:
+        bot.send_message(message.chat.id, 'Неправильный формат даты. Пожалуйста, введите дату в формате дд.мм.гггг или "нет":')
+        conversation.set_step(message.chat.id, 'get_repeat_until', reminder_text=reminder_text, reminder_date=reminder_date, unit=unit, quantity=quantity)
+        return
+    add_reminder_to_db(message, reminder_text, datetime.datetime.fromtimestamp(reminder_date), (unit, quantity, repeat_until))
+
+# Функция для добавления напоминания в базу данных.
+# repeat - (единица, количество, дата окончания или None) для повторяющихся напоминаний
+def add_reminder_to_db(message, reminder_text, reminder_date, repeat=None):
     try:
-        # Конвертируем дату напоминания в строку
-        reminder_date_str = reminder_date.strftime('%Y-%m-%d')
+        # Дата напоминания хранится как epoch-время
+        reminder_ts = to_epoch(reminder_date)
 
         # Устанавливаем тип напоминания
-        reminder_type = 'One-time'
-
-        # Создаем новое подключение к базе данных и курсор
-        conn = sqlite3.connect('reminders.db')
-        c = conn.cursor()
+        reminder_type = 'Recurring' if repeat else 'One-time'
+        repeat_unit, repeat_every, repeat_until = repeat or (None, None, None)
 
         # Добавляем напоминание в базу данных
-        c.execute('''INSERT INTO reminders (chat_id, reminder_text, reminder_date, reminder_type) VALUES (?, ?, ?, ?)''', (message.chat.id, reminder_text, reminder_date_str, reminder_type))
-        conn.commit()
+        storage.execute('''INSERT INTO reminders (chat_id, reminder_text, reminder_date, reminder_type, repeat_unit, repeat_every, repeat_until) VALUES (?, ?, ?, ?, ?, ?, ?)''', (message.chat.id, reminder_text, reminder_ts, reminder_type, repeat_unit, repeat_every, repeat_until))
 
-        # Закрываем подключение к базе данных
-        conn.close()
+        # Будим планировщик, если это напоминание раньше текущего ближайшего
+        schedule_due(reminder_date)
 
         # Отправляем сообщение пользователю о том, что напоминание добавлено
         bot.send_message(message.chat.id, 'Напоминание добавлено.', reply_markup=start_now())
@@ -157,55 +400,167 @@ def add_reminder_to_db(message, reminder_text, reminder_date):
         # Если произошла ошибка, сообщаем об этом пользователю
         print(f"An error occurred: {e}")
 
-# Function to send reminders due in two weeks
+# Reminders due within this window are announced as "уценка"
+DISCOUNT_WINDOW = datetime.timedelta(weeks=2)
+
+# The sweep only picks up reminders that entered the window since the last run, so it can run often
+DISCOUNT_SWEEP_INTERVAL = 3600
+
+# Announced reminders that are not due yet: (reminder_date, id, reminder_text), sorted.
+# Kept up to date by the sweep and used to answer 'check_discount' without a scan.
+discount_window = []
+discount_lock = threading.Lock()
+
+
+def load_discount_window():
+    now = int(time.time())
+    try:
+        rows = storage.query('''SELECT reminder_date, id, reminder_text FROM reminders WHERE discount_notified = 1 AND reminder_date > ? ORDER BY reminder_date, id''', (now,))
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return
+    with discount_lock:
+        discount_window[:] = rows
+
+
+# Reminders of a digest that wasn't delivered go back to discount_notified = 0
+def release_discount(reminder_ids):
+    def callback(ok):
+        if not ok:
+            storage.executemany('''UPDATE reminders SET discount_notified = 0 WHERE id = ?''', [(reminder_id,) for reminder_id in reminder_ids])
+    return callback
+
+
+# Lines joined into texts of at most MAX_MESSAGE_LENGTH, split only between lines
+def join_lines(lines):
+    texts = []
+    current = None
+    for line in lines:
+        line = line[:MAX_MESSAGE_LENGTH]
+        if current is not None and len(current) + 1 + len(line) <= MAX_MESSAGE_LENGTH:
+            current += '\n' + line
+            continue
+        if current is not None:
+            texts.append(current)
+        current = line
+    if current is not None:
+        texts.append(current)
+    return texts
+
+
+# Queue a digest (header and its lines) as whole messages of its own, so the send
+# queue never interleaves it with other texts for the chat. on_done(ok) runs once,
+# after every part has been sent (True) or any part given up (False).
+def put_digest(chat_id, lines, on_done=None):
+    texts = join_lines(lines)
+    results = []
+    lock = threading.Lock()
+
+    def part_done(ok):
+        with lock:
+            results.append(ok)
+            if len(results) < len(texts):
+                return
+        on_done(all(results))
+
+    for text in texts:
+        outbox.put(chat_id, text, part_done if on_done else None)
+
+
+# Function to announce reminders that entered the two-week window since the last sweep
 def send_two_week_reminders():
     try:
         # Get the current time and the time after two weeks
         now = datetime.datetime.now()
-        two_weeks_later = now + datetime.timedelta(weeks=2)
-
-        # Create a new database connection and cursor within the thread
-        conn = sqlite3.connect('reminders.db')
-        c = conn.cursor()
+        two_weeks_later = to_epoch(now + DISCOUNT_WINDOW)
+        now = to_epoch(now)
+
+        # Take the not yet announced reminders in the window (partial index) and mark them
+        def take_new(conn):
+            reminders = conn.execute('''SELECT reminder_date, id, reminder_text FROM reminders WHERE discount_notified = 0 AND reminder_date > ? AND reminder_date <= ? ORDER BY reminder_date, id''', (now, two_weeks_later)).fetchall()
+            conn.executemany('''UPDATE reminders SET discount_notified = 1 WHERE id = ?''', [(reminder[1],) for reminder in reminders])
+            return reminders
+        reminders = storage.write(take_new).result()
+
+        with discount_lock:
+            # Keyed by id: a reminder released after a failed send comes back in a later sweep
+            window = {reminder[1]: reminder for reminder in discount_window if reminder[0] > now}
+            window.update((reminder[1], reminder) for reminder in reminders)
+            discount_window[:] = sorted(window.values())
+
+        # One digest for the specified chat, released as a whole if it can't be delivered
+        if reminders:
+            lines = [f"Уценка, новых позиций: {len(reminders)}"]
+            lines += [f"{reminder_text} (уценка)" for reminder_date, reminder_id, reminder_text in reminders]
+            put_digest(chatid, lines, release_discount([reminder[1] for reminder in reminders]))
 
-        # Get all reminders due in two weeks
-        reminders = c.execute('''SELECT * FROM reminders WHERE reminder_date > ? AND reminder_date <= ?''', (now, two_weeks_later)).fetchall()
+    except Exception as e:
+        print(f"An error occurred: {e}")
 
-        # Send reminders to the specified chat
-        for reminder in reminders:
-            bot.send_message(chatid, f"{reminder[1]} (уценка)")
 
-        # Close the database connection
-        conn.close()
+# Текущее окно уценки из кэша, без повторного сканирования таблицы
+def send_discount_window(chat_id):
+    now = int(time.time())
+    with discount_lock:
+        reminders = [reminder for reminder in discount_window if reminder[0] > now]
+    if not reminders:
+        bot.send_message(chat_id, 'Позиций для уценки нет.', reply_markup=start_now())
+        return
+    lines = [f"Уценка, позиций: {len(reminders)}"]
+    lines += [f"{reminder_text} (уценка до {format_date(reminder_date)})" for reminder_date, reminder_id, reminder_text in reminders]
+    put_digest(chat_id, lines)
 
-    except Exception as e:
-        print(f"An error occurred: {e}")
 
 def check_sendtwoweek():
+    load_discount_window()
     while True:
-        send_two_week_reminders()
-        time.sleep(604054)
+        if scheduler_lease.is_leader():
+            send_two_week_reminders()
+            # Заодно чистим брошенные диалоги и старые месяцы архива
+            try:
+                conversation.purge_expired()
+                archive.prune()
+            except Exception as e:
+                print(f"An error occurred: {e}")
+            time.sleep(DISCOUNT_SWEEP_INTERVAL)
+        else:
+            # Other replicas only keep their copy of the window fresh for 'check_discount'
+            scheduler_lease.wait(DISCOUNT_SWEEP_INTERVAL)
+            load_discount_window()
 
-# Start the thread for checking reminders every 10 minutes
-reminder_thread = threading.Thread(target=check_sendtwoweek)
-reminder_thread.start()
+# The discount sweep thread, started in main()
+discount_thread = threading.Thread(target=check_sendtwoweek)
 
 # Обработчик команды /start
 @bot.message_handler(commands=['start'])
 def start(message):
+    # /start прерывает незаконченный диалог
+    conversation.clear(message.chat.id)
+
     # Создаем клавиатуру с кнопками
     keyboard = telebot.types.InlineKeyboardMarkup()
     button1 = telebot.types.InlineKeyboardButton(text='Добавить напоминание', callback_data='add_reminder')
     button2 = telebot.types.InlineKeyboardButton(text='Просмотреть напоминания', callback_data='list_reminders')
     button3 = telebot.types.InlineKeyboardButton(text='Проверить уценку', callback_data='check_discount')
     button4 = telebot.types.InlineKeyboardButton(text='Добавить список напоминаний', callback_data='add_reminder_list')
-    keyboard.add(button1, button2, button3, button4)
+    button5 = telebot.types.InlineKeyboardButton(text='Поиск', callback_data='search')
+    keyboard.add(button1, button2, button3, button4, button5)
 
     # Отправляем сообщение с клавиатурой
     bot.send_message(message.chat.id, 'Выберите действие:', reply_markup=keyboard)
 
+# Замер длительности обработчика кнопки; page:next:... и page:prev:... считаются вместе
+def timed_callback(handler):
+    @functools.wraps(handler)
+    def wrapper(call):
+        with HANDLER_SECONDS.time(handler=(call.data or '').split(':')[0]):
+            return handler(call)
+    return wrapper
+
+
 # Обработчик нажатия на кнопку
 @bot.callback_query_handler(func=lambda call: True)
+@timed_callback
 def callback_query(call):
     # Получаем данные из callback_data
     data = call.data
@@ -213,99 +568,327 @@ def callback_query(call):
     if data == 'add_reminder':
         # Запрашиваем у пользователя текст напоминания
         bot.send_message(call.message.chat.id, 'Введите текст напоминания:')
-        # Регистрируем обработчик для получения текста напоминания
-        bot.register_next_step_handler(call.message, get_reminder_text)
+        # Следующее сообщение в чате - текст напоминания
+        conversation.set_step(call.message.chat.id, 'get_reminder_text')
     elif data == 'list_reminders':
-        reminders_info = list_all_reminders()
-        bot.send_message(call.message.chat.id, reminders_info, reply_markup=start_now())
-        # Check reminders that are due
-        send_due_reminders()
+        reminders_info, keyboard = list_all_reminders()
+        bot.send_message(call.message.chat.id, reminders_info, reply_markup=keyboard)
+        # Check reminders that are due; other replicas leave this to the lease holder
+        if scheduler_lease.is_leader():
+            send_due_reminders()
+    elif data.startswith('page:'):
+        # Листаем список: page:next:<дата>:<id> или page:prev:<дата>:<id>
+        _, direction, reminder_date, reminder_id = data.split(':')
+        key = (int(reminder_date), int(reminder_id))
+        if direction == 'next':
+            reminders_info, keyboard = list_all_reminders(after=key)
+        else:
+            reminders_info, keyboard = list_all_reminders(before=key)
+        bot.edit_message_text(reminders_info, call.message.chat.id, call.message.message_id, reply_markup=keyboard)
     elif data == 'check_discount':
-        # Check discounts immediately
-        send_two_week_reminders()
+        # Сначала объявляем только новые позиции (это делает только держатель аренды,
+        # остальные перечитывают окно), затем отвечаем из кэша окна
+        if scheduler_lease.is_leader():
+            send_two_week_reminders()
+        else:
+            load_discount_window()
+        send_discount_window(call.message.chat.id)
+    elif data == 'search':
+        bot.send_message(call.message.chat.id, 'Введите название или начало названия позиции:')
+        conversation.set_step(call.message.chat.id, 'search_step')
     elif data == 'add_reminder_list':
-        bot.send_message(call.message.chat.id, 'Введите список напоминаний в формате:\nНазвание_напоминания1 / дата1\nНазвание_напоминания2 / дата2\n...')
-        bot.register_next_step_handler(call.message, get_reminder_list)
+        bot.send_message(call.message.chat.id, 'Введите список напоминаний в формате:\nНазвание_напоминания1 / дата1\nНазвание_напоминания2 / дата2\n...\nДля повторяющихся добавьте интервал: Название / дата / 1 месяц\nМожно также отправить CSV/текстовый файл с такими строками')
+        conversation.set_step(call.message.chat.id, 'get_reminder_list')
 
 # Функция для отправки напоминаний, время которых наступило
 def send_due_reminders():
-    # Get the current time
-    now = datetime.datetime.now()
-
-    # Create a new database connection and cursor
-    conn = sqlite3.connect('reminders.db')
-    c = conn.cursor()
-
-    # Get reminders that are due
-    due_reminders = c.execute('''SELECT * FROM reminders WHERE reminder_date <= ?''', (now,)).fetchall()
-
-    # Send due reminders to users
-    for reminder in due_reminders:
-        bot.send_message(chatid, reminder[1])
-        # Delete the reminder from the database
-        c.execute('''DELETE FROM reminders WHERE chat_id = ? AND reminder_text = ? AND reminder_date = ?''', (reminder[0], reminder[1], reminder[2]))
-        conn.commit()
-
-    # Close the database connection
-    conn.close()
-
-# Функция для получения списка всех напоминаний для всех пользователей
-def list_all_reminders(page=1):
-    # Create a new database connection and cursor
-    conn = sqlite3.connect('reminders.db')
-    c = conn.cursor()
-
-    # Calculate the limit and offset for pagination
-    limit = 20
-    offset = (page - 1) * limit
-
-    # Get reminders for the current page
-    reminders = c.execute('''SELECT chat_id, reminder_text, reminder_date FROM reminders LIMIT ? OFFSET ?''', (limit, offset)).fetchall()
-
-    # Close the database connection
-    conn.close()
+    # Тот же путь, что и у планировщика: заявка на пачку исключает двойную отправку
+    check_reminders()
+
+# Размер страницы списка напоминаний
+PAGE_SIZE = 20
+
+# Telegram не принимает сообщения длиннее 4096 символов
+MAX_MESSAGE_LENGTH = 4096
+
+
+def format_reminder(reminder):
+    return f"Пользователь: {reminder[0]}, Позиция: {reminder[1]}, Время окончания: {format_date(reminder[2])}"
+
+
+# Строки после ключа (reminder_date, id) в порядке списка. Даты хранятся с точностью
+# до дня, и у многих строк одна и та же reminder_date: условие (reminder_date, id) > (?, ?)
+# SQLite ищет по индексу только по дате и перебирает весь день. Поэтому сначала
+# остаток того же дня по id, затем следующие дни - оба запроса идут по индексу от ключа.
+def reminders_after(key, limit):
+    reminder_date, reminder_id = key
+    reminders = storage.query('''SELECT chat_id, reminder_text, reminder_date, id FROM reminders WHERE reminder_date = ? AND id > ? ORDER BY id LIMIT ?''', (reminder_date, reminder_id, limit))
+    if len(reminders) < limit:
+        reminders += storage.query('''SELECT chat_id, reminder_text, reminder_date, id FROM reminders WHERE reminder_date > ? ORDER BY reminder_date, id LIMIT ?''', (reminder_date, limit - len(reminders)))
+    return reminders
+
+
+# Строки перед ключом, от ближайшей к ключу (индекс читается в обратную сторону)
+def reminders_before(key, limit):
+    reminder_date, reminder_id = key
+    reminders = storage.query('''SELECT chat_id, reminder_text, reminder_date, id FROM reminders WHERE reminder_date = ? AND id < ? ORDER BY id DESC LIMIT ?''', (reminder_date, reminder_id, limit))
+    if len(reminders) < limit:
+        reminders += storage.query('''SELECT chat_id, reminder_text, reminder_date, id FROM reminders WHERE reminder_date < ? ORDER BY reminder_date DESC, id DESC LIMIT ?''', (reminder_date, limit - len(reminders)))
+    return reminders
+
+
+# Функция для получения списка всех напоминаний для всех пользователей.
+# Страницы идут по ключу (reminder_date, id) вместо OFFSET, поэтому любая
+# страница читается по индексу так же быстро, как первая.
+def list_all_reminders(after=None, before=None):
+    if before is not None:
+        # Страница перед ключом: читаем индекс в обратную сторону
+        reminders = reminders_before(before, PAGE_SIZE + 1)
+        has_prev = len(reminders) > PAGE_SIZE
+        has_next = True
+        reminders = reminders[:PAGE_SIZE][::-1]
+    else:
+        if after is not None:
+            reminders = reminders_after(after, PAGE_SIZE + 1)
+        else:
+            reminders = storage.query('''SELECT chat_id, reminder_text, reminder_date, id FROM reminders ORDER BY reminder_date, id LIMIT ?''', (PAGE_SIZE + 1,))
+        has_prev = after is not None
+        has_next = len(reminders) > PAGE_SIZE
+        reminders = reminders[:PAGE_SIZE]
 
     if not reminders:
-        return "Нету напоминаний"
-
-    reminder_list = ""
-    for reminder in reminders:
-        reminder_list += f"Пользователь: {reminder[0]}, Позиция: {reminder[1]}, Время окончания: {reminder[2]}\n"
+        return "Нету напоминаний", start_now()
+
+    # Обрезаем страницу, если она не влезает в одно сообщение; при листании назад
+    # оставляем строки, ближайшие к ключу
+    ordered = reminders[::-1] if before is not None else reminders
+    page = []
+    total = 0
+    for reminder in ordered:
+        line = format_reminder(reminder)
+        if page and total + len(line) + 1 > MAX_MESSAGE_LENGTH:
+            if before is not None:
+                has_prev = True
+            else:
+                has_next = True
+            break
+        page.append((reminder, line))
+        total += len(line) + 1
+    if before is not None:
+        page.reverse()
+    reminders = [reminder for reminder, _ in page]
+
+    first_key = f"{reminders[0][2]}:{reminders[0][3]}"
+    last_key = f"{reminders[-1][2]}:{reminders[-1][3]}"
+    navigation = []
+    if has_prev:
+        navigation.append(telebot.types.InlineKeyboardButton(text='◀ Назад', callback_data=f'page:prev:{first_key}'))
+    if has_next:
+        navigation.append(telebot.types.InlineKeyboardButton(text='Вперёд ▶', callback_data=f'page:next:{last_key}'))
+
+    keyboard = start_now()
+    if navigation:
+        keyboard.keyboard.insert(0, navigation)
+
+    return '\n'.join(line for _, line in page)[:MAX_MESSAGE_LENGTH], keyboard
+
+# Сколько совпадений показывать в поиске
+SEARCH_LIMIT = 20
+
+
+# Полнотекстовый поиск по FTS5-индексу: каждое слово запроса ищется как префикс,
+# результаты отсортированы по релевантности (bm25)
+def search_reminders(text):
+    terms = re.findall(r'\w+', text.replace('ё', 'е').replace('Ё', 'Е'))
+    if not terms:
+        return []
+    match = ' '.join(f'"{term}"*' for term in terms)
+    return storage.query('''SELECT r.chat_id, r.reminder_text, r.reminder_date, r.id FROM reminders_fts JOIN reminders r ON r.id = reminders_fts.rowid WHERE reminders_fts MATCH ? ORDER BY rank LIMIT ?''', (match, SEARCH_LIMIT))
+
+
+def send_search_results(message, text):
+    reminders = search_reminders(text)
+    if not reminders:
+        bot.send_message(message.chat.id, 'Ничего не найдено.', reply_markup=start_now())
+        return
+    lines = [f'Найдено: {len(reminders)}'] + [format_reminder(reminder) for reminder in reminders]
+    bot.send_message(message.chat.id, '\n'.join(lines)[:MAX_MESSAGE_LENGTH], reply_markup=start_now())
+
+
+# Шаг диалога после кнопки "Поиск"
+def search_step(message):
+    send_search_results(message, message.text or '')
+
+
+# Обработчик команды /search <текст>
+@bot.message_handler(commands=['search'])
+def search_command(message):
+    text = message.text.partition(' ')[2]
+    if not text.strip():
+        bot.send_message(message.chat.id, 'Использование: /search название')
+        return
+    send_search_results(message, text)
+
+
+# Сколько сработавших напоминаний показывать в /history
+HISTORY_LIMIT = 20
+
+
+# Обработчик команды /history: последние сработавшие напоминания из архива
+@bot.message_handler(commands=['history'])
+def history_command(message):
+    rows = archive.history(HISTORY_LIMIT)
+    if not rows:
+        bot.send_message(message.chat.id, 'История пуста')
+        return
+    lines = ['Последние сработавшие напоминания:'] + [f"{format_reminder(row)}, Сработало: {format_date(row[3])}" for row in rows]
+    bot.send_message(message.chat.id, '\n'.join(lines)[:MAX_MESSAGE_LENGTH])
+
+
+# Строка списка: "Название / дд.мм.гггг", для повторяющихся "Название / дд.мм.гггг / 1 месяц";
+# в файлах разделителем может быть также ; , или табуляция
+REMINDER_LINE = re.compile(r'^\s*"?(.*?)"?\s*[/;,\t]\s*"?(\d{1,2}\.\d{1,2}\.\d{4})"?(?:\s*[/;,\t]\s*"?(\d+)\s*(\w+)"?)?\s*$')
+
+# Единица повтора в списке по первой букве: дни/день, недели/неделя, месяцы/месяц
+REPEAT_UNIT_PREFIXES = {'д': 'days', 'н': 'weeks', 'м': 'months'}
+
+# Сколько ошибок показывать в отчете об импорте
+MAX_REPORTED_ERRORS = 20
+
+# Файлы, которые принимаются для импорта списка
+IMPORT_EXTENSIONS = ('.csv', '.txt')
+IMPORT_FORMATS_HELP = 'Принимаются файлы .csv и .txt, по напоминанию в строке:\nНазвание / дд.мм.гггг\nВместо / можно использовать ; , или табуляцию.'
+
+
+# Потоковый разбор строк: корректные строки отдаются как строки таблицы,
+# ошибки складываются в errors как (номер строки, причина)
+def parse_reminder_lines(lines, chat_id, errors, due_dates):
+    for lineno, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        match = REMINDER_LINE.match(line)
+        if not match or not match.group(1):
+            errors.append((lineno, 'ожидается "Название / дд.мм.гггг"'))
+            continue
+        try:
+            reminder_date = datetime.datetime.strptime(match.group(2), '%d.%m.%Y')
+        except ValueError:
+            errors.append((lineno, f'неверная дата {match.group(2)}'))
+            continue
+        repeat_unit = repeat_every = None
+        if match.group(3):
+            repeat_unit = REPEAT_UNIT_PREFIXES.get(match.group(4)[0].lower())
+            repeat_every = int(match.group(3))
+            if repeat_unit is None or repeat_every <= 0:
+                errors.append((lineno, f'неверный повтор {match.group(3)} {match.group(4)}'))
+                continue
+        reminder_ts = to_epoch(reminder_date)
+        due_dates.add(reminder_ts)
+        yield (chat_id, match.group(1).strip(), reminder_ts, 'Recurring' if repeat_unit else 'One-time', repeat_unit, repeat_every)
+
+
+# Импорт списка напоминаний одной транзакцией (executemany прямо из разбора).
+# Возвращает число добавленных строк и список ошибок.
+def import_reminders(chat_id, lines):
+    errors = []
+    due_dates = set()
+    added = storage.executemany('''INSERT INTO reminders (chat_id, reminder_text, reminder_date, reminder_type, repeat_unit, repeat_every) VALUES (?, ?, ?, ?, ?, ?)''', parse_reminder_lines(lines, chat_id, errors, due_dates))
+
+    # Put the new due dates on the scheduler heap
+    for reminder_ts in due_dates:
+        schedule_due(datetime.datetime.fromtimestamp(reminder_ts))
+    return added, errors
+
+
+def import_report(added, errors):
+    report = [f'Добавлено напоминаний: {added}.']
+    if errors:
+        report.append(f'Строк с ошибками: {len(errors)}')
+        report += [f'Строка {lineno}: {reason}' for lineno, reason in errors[:MAX_REPORTED_ERRORS]]
+        if len(errors) > MAX_REPORTED_ERRORS:
+            report.append('...')
+    return '\n'.join(report)
 
-    return reminder_list
 
 # Обработчик для получения списка напоминаний
 def get_reminder_list(message):
+    if message.content_type == 'document':
+        if not import_document(message):
+            # Файл не принят: ждем другой файл или список текстом
+            conversation.set_step(message.chat.id, 'get_reminder_list')
+        return
+
+    added, errors = import_reminders(message.chat.id, (message.text or '').split('\n'))
+    if added:
+        bot.send_message(message.chat.id, import_report(added, errors), reply_markup=start_now())
+        return
+
+    if errors:
+        # Ни одной верной строки: показываем, что не так в каждой, и ждем исправленный список
+        bot.send_message(message.chat.id, import_report(added, errors))
+    else:
+        bot.send_message(message.chat.id, 'Ошибка в формате списка напоминаний. Пожалуйста, введите список в формате:\nНазвание_напоминания1 / дата1\nНазвание_напоминания2 / дата2\n...')
+    conversation.set_step(message.chat.id, 'get_reminder_list')
+
+
+# Шаги диалога, которые можно продолжить по сохраненному состоянию
+CONVERSATION_STEPS = {
+    'get_reminder_text': get_reminder_text,
+    'get_start_date': get_start_date,
+    'get_units': get_units,
+    'get_quantity': get_quantity,
+    'get_repeat': get_repeat,
+    'get_repeat_until': get_repeat_until,
+    'get_reminder_list': get_reminder_list,
+    'search_step': search_step,
+}
+
+
+def has_pending_step(message):
+    if message.content_type == 'text' and message.text.startswith('/'):
+        return False
+    return conversation.get_step(message.chat.id) is not None
+
+
+# Продолжаем диалог с того шага, на котором чат остановился (в том числе после
+# перезапуска или если сообщение пришло в другой процесс бота). Регистрируется
+# раньше обработчика документов, чтобы файл на шаге get_reminder_list попал сюда
+@bot.message_handler(func=has_pending_step, content_types=['text', 'document'])
+def resume_conversation(message):
+    state = conversation.get_step(message.chat.id)
+    if state is None:
+        return
+    step, data = state
+    if message.content_type == 'document' and step != 'get_reminder_list':
+        # Файл посреди другого шага - это импорт; шаг остается ждать своего ответа
+        import_document(message)
+        return
+    # Шаг сам сохраняет следующий, если диалог продолжается
+    conversation.clear(message.chat.id)
+    with HANDLER_SECONDS.time(handler=step):
+        CONVERSATION_STEPS[step](message, **data)
+
+
+# Импорт списка напоминаний из загруженного CSV/текстового файла.
+# Возвращает False, если файл не подходит (пользователю уже ответили).
+@bot.message_handler(content_types=['document'])
+def import_document(message):
+    document = message.document
+    if not (document.file_name or '').lower().endswith(IMPORT_EXTENSIONS):
+        bot.send_message(message.chat.id, IMPORT_FORMATS_HELP)
+        return False
+
+    data = bot.download_file(bot.get_file(document.file_id).file_path)
     try:
-        # Split the message into lines to extract each reminder
-        reminder_lines = message.text.split('\n')
-
-        # Create a new database connection and cursor within the thread
-        conn = sqlite3.connect('reminders.db')
-        c = conn.cursor()
-
-        # Add each reminder to the database
-        for line in reminder_lines:
-            reminder_info = line.split('/')
-            if len(reminder_info) == 2:
-                reminder_text = reminder_info[0].strip()
-                reminder_date = datetime.datetime.strptime(reminder_info[1].strip(), '%d.%m.%Y')
-                reminder_date_str = reminder_date.strftime('%Y-%m-%d')
-                reminder_type = 'One-time'
-                c.execute('''INSERT INTO reminders (chat_id, reminder_text, reminder_date, reminder_type) VALUES (?, ?, ?, ?)''', (message.chat.id, reminder_text, reminder_date_str, reminder_type))
-                conn.commit()
-
-        # Close the database connection
-        conn.close()
-
-        # Send a message to the user indicating that the reminders have been added
-        bot.send_message(message.chat.id, 'Список напоминаний добавлен.', reply_markup=start_now())
+        data.decode('utf-8-sig')
+        encoding = 'utf-8-sig'
+    except UnicodeDecodeError:
+        # Excel на русской Windows сохраняет CSV в cp1251
+        encoding = 'cp1251'
 
-    except ValueError:
-        
-        bot.send_message(message.chat.id, 'Ошибка в формате списка напоминаний. Пожалуйста, введите список в формате:\nНазвание_напоминания1 / дата1\nНазвание_напоминания2 / дата2\n...')
-        
-        bot.register_next_step_handler(message, get_reminder_list)
+    added, errors = import_reminders(message.chat.id, io.TextIOWrapper(io.BytesIO(data), encoding=encoding, newline=''))
+    bot.send_message(message.chat.id, import_report(added, errors), reply_markup=start_now())
+    return True
 
 def start_now():
     # Создаем клавиатуру с кнопками
@@ -314,8 +897,31 @@ def start_now():
     button2 = telebot.types.InlineKeyboardButton(text='Просмотреть напоминания', callback_data='list_reminders')
     button3 = telebot.types.InlineKeyboardButton(text='Проверить уценку', callback_data='check_discount')
     button4 = telebot.types.InlineKeyboardButton(text='Добавить список напоминаний', callback_data='add_reminder_list')
-    keyboard.add(button1, button2, button3, button4)
+    button5 = telebot.types.InlineKeyboardButton(text='Поиск', callback_data='search')
+    keyboard.add(button1, button2, button3, button4, button5)
     return keyboard
 
-# Start the bot's polling loop
-bot.polling()
+# Обработка одного обновления, пришедшего на webhook
+def handle_update(update):
+    bot.process_new_updates([telebot.types.Update.de_json(update)])
+
+
+def main():
+    if METRICS_PORT:
+        metrics.start_server(METRICS_PORT)
+    scheduler_lease.start()
+    reminder_thread.start()
+    discount_thread.start()
+
+    if BOT_MODE == 'webhook':
+        if WEBHOOK_URL:
+            bot.remove_webhook()
+            bot.set_webhook(url=WEBHOOK_URL + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET or None)
+        webhook.serve(handle_update, port=WEBHOOK_PORT, path=WEBHOOK_PATH, secret=WEBHOOK_SECRET, workers=WEBHOOK_WORKERS)
+    else:
+        # Start the bot's polling loop
+        bot.polling()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+import time
+from email.utils import formatdate
+from urllib.parse import unquote, urlsplit
+
+# Files this large stay on disk and are sent with sendfile instead of being held in memory
+SENDFILE_MIN_SIZE = 1 << 20
+
+# Smaller files aren't worth a gzip variant
+GZIP_MIN_SIZE = 256
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'application/xml', 'image/svg+xml')
+
+# Server-side files that may sit next to the frontend and must not be served
+# (sources, logs, SQLite databases with their journals)
+SKIP_SUFFIXES = ('.py', '.pyc', '.log', '.db', '.sqlite', '-wal', '-shm', '-journal')
+
+# Seconds between checks of the directory for changed files
+RELOAD_INTERVAL = 2.0
+
+# HTML revalidates every time (a 304 is cheap); other assets may be reused for an hour
+HTML_CACHE_CONTROL = 'no-cache'
+ASSET_CACHE_CONTROL = 'public, max-age=3600'
+
+
+class StaticFile:
+    __slots__ = ('path', 'mtime_ns', 'size', 'content_type', 'cache_control', 'last_modified', 'etag', 'body', 'gzip_etag', 'gzip_body')
+
+    def __init__(self, path: str, stat: os.stat_result):
+        self.path = path
+        self.mtime_ns = stat.st_mtime_ns
+        self.size = stat.st_size
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if self.content_type.startswith('text/') or self.content_type in ('application/javascript', 'application/json'):
+            self.content_type += '; charset=utf-8'
+        self.cache_control = HTML_CACHE_CONTROL if self.content_type.startswith('text/html') else ASSET_CACHE_CONTROL
+        self.last_modified = formatdate(stat.st_mtime, usegmt=True)
+        self.body = None
+        self.gzip_etag = None
+        self.gzip_body = None
+        if self.size >= SENDFILE_MIN_SIZE:
+            self.etag = f'"{self.size:x}-{self.mtime_ns:x}"'
+            return
+
+        with open(path, 'rb') as f:
+            self.body = f.read()
+        digest = hashlib.sha1(self.body).hexdigest()[:20]
+        self.etag = f'"{digest}"'
+        if len(self.body) >= GZIP_MIN_SIZE and self.content_type.startswith(COMPRESSIBLE_TYPES):
+            compressed = gzip.compress(self.body, compresslevel=9, mtime=0)
+            if len(compressed) < len(self.body):
+                self.gzip_body = compressed
+                self.gzip_etag = f'"{digest}-gz"'
+
+
+# Snapshot of every file under a directory, keyed by URL path ('/main.js'), or only
+# of the listed ones (paths relative to the directory) when `only` is given.
+# A reload builds a new dict and swaps it in, so readers never see a half-updated cache.
+class StaticCache:
+    def __init__(self, directory: str, reload_interval: float = RELOAD_INTERVAL, only=None):
+        self.directory = os.path.abspath(directory)
+        self.only = None if only is None else {'/' + name.lstrip('/') for name in only}
+        self.files = {}
+        self.reload()
+        if reload_interval:
+            threading.Thread(target=self._watch, args=(reload_interval,), daemon=True).start()
+
+    def reload(self):
+        files = {}
+        for root, dirs, names in os.walk(self.directory):
+            dirs[:] = [name for name in dirs if not name.startswith('.') and name != '__pycache__']
+            for name in names:
+                if name.startswith('.') or name.endswith(SKIP_SUFFIXES):
+                    continue
+                path = os.path.join(root, name)
+                url_path = '/' + os.path.relpath(path, self.directory).replace(os.sep, '/')
+                if self.only is not None and url_path not in self.only:
+                    continue
+                try:
+                    stat = os.stat(path)
+                    cached = self.files.get(url_path)
+                    if cached and cached.mtime_ns == stat.st_mtime_ns and cached.size == stat.st_size:
+                        files[url_path] = cached
+                    else:
+                        files[url_path] = StaticFile(path, stat)
+                except OSError:
+                    # Removed or unreadable since os.walk saw it
+                    continue
+        self.files = files
+
+    def _watch(self, interval: float):
+        while True:
+            time.sleep(interval)
+            try:
+                self.reload()
+            except Exception as e:
+                print(f"An error occurred: {e}")
+
+    # Cached file for a request path ('/' and 'dir/' mean index.html), or None
+    def get(self, request_path: str):
+        path = unquote(urlsplit(request_path).path)
+        if path.endswith('/'):
+            path += 'index.html'
+        return self.files.get(path)
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    for part in accept_encoding.split(','):
+        name, _, params = part.partition(';')
+        if name.strip().lower() not in ('gzip', '*'):
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        return quality > 0
+    return False
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags or 'W/' + etag in tags
+
+
+# Write the response for a cached file to a BaseHTTPRequestHandler: 304 when the
+# client's copy is current, the gzip variant when accepted, sendfile for large files.
+def send_static(handler, entry: StaticFile, head: bool = False):
+    use_gzip = entry.gzip_body is not None and _accepts_gzip(handler.headers.get('Accept-Encoding', ''))
+    etag = entry.gzip_etag if use_gzip else entry.etag
+
+    if _etag_matches(handler.headers.get('If-None-Match', ''), etag):
+        handler.send_response(304)
+        handler.send_header('ETag', etag)
+        handler.send_header('Cache-Control', entry.cache_control)
+        if entry.gzip_body is not None:
+            handler.send_header('Vary', 'Accept-Encoding')
+        handler.end_headers()
+        return
+
+    body = entry.gzip_body if use_gzip else entry.body
+    handler.send_response(200)
+    handler.send_header('Content-Type', entry.content_type)
+    handler.send_header('Content-Length', str(entry.size if body is None else len(body)))
+    handler.send_header('ETag', etag)
+    handler.send_header('Last-Modified', entry.last_modified)
+    handler.send_header('Cache-Control', entry.cache_control)
+    if entry.gzip_body is not None:
+        handler.send_header('Vary', 'Accept-Encoding')
+    if use_gzip:
+        handler.send_header('Content-Encoding', 'gzip')
+    handler.end_headers()
+    if head:
+        return
+    if body is not None:
+        handler.wfile.write(body)
+        return
+    with open(entry.path, 'rb') as f:
+        handler.connection.sendfile(f, 0, entry.size)
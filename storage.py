@@ -0,0 +1,262 @@
+import datetime
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+import metrics
+
+# Путь к базе напоминаний (можно переопределить для тестов и бенчмарков)
+DB_PATH = os.environ.get('REMINDERS_DB', 'reminders.db')
+
+# Read connections kept open in WAL mode
+READ_POOL_SIZE = 4
+
+# Max queued write operations applied in one transaction
+GROUP_COMMIT_MAX = 256
+
+# How long a connection waits for a lock held by another process
+BUSY_TIMEOUT = 30
+
+_read_pool = queue.Queue()
+_write_queue = queue.Queue()
+_writer_thread = None
+
+QUERY_SECONDS = metrics.Histogram('sqlite_query_seconds', 'Time spent in SQLite per call site', labels=('site', 'kind'))
+COMMIT_SECONDS = metrics.Histogram('sqlite_commit_seconds', 'Time to commit one group of write operations')
+COMMIT_GROUP_SIZE = metrics.Histogram('sqlite_commit_group_size', 'Write operations applied per commit', buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+
+
+def _connect():
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+    conn.execute('''PRAGMA journal_mode = WAL''')
+    conn.execute('''PRAGMA synchronous = NORMAL''')
+    return conn
+
+
+# v1: INTEGER PRIMARY KEY, epoch reminder_date and an index on the due date.
+# Converts a legacy table (no key, 'YYYY-MM-DD' strings) in place.
+def _migrate_v1(c):
+    legacy = c.execute('''SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?''', ('reminders',)).fetchone()
+    if legacy:
+        c.execute('''ALTER TABLE reminders RENAME TO reminders_v0''')
+    c.execute('''CREATE TABLE reminders (
+        id INTEGER PRIMARY KEY,
+        chat_id INTEGER NOT NULL,
+        reminder_text TEXT NOT NULL,
+        reminder_date INTEGER NOT NULL,
+        reminder_type TEXT NOT NULL DEFAULT 'One-time')''')
+    c.execute('''CREATE INDEX idx_reminders_date ON reminders (reminder_date)''')
+    if not legacy:
+        return
+
+    rows = []
+    skipped = 0
+    for chat_id, reminder_text, reminder_date, reminder_type in c.execute('''SELECT chat_id, reminder_text, reminder_date, reminder_type FROM reminders_v0'''):
+        try:
+            date = datetime.datetime.strptime(str(reminder_date)[:10], '%Y-%m-%d')
+        except ValueError:
+            skipped += 1
+            continue
+        rows.append((chat_id, reminder_text or '', int(date.timestamp()), reminder_type or 'One-time'))
+    c.executemany('''INSERT INTO reminders (chat_id, reminder_text, reminder_date, reminder_type) VALUES (?, ?, ?, ?)''', rows)
+    c.execute('''DROP TABLE reminders_v0''')
+    if skipped:
+        print(f"Migration skipped {skipped} reminders with unreadable dates")
+
+
+# v2: claimed_until marks rows taken by a dispatcher; NULL means free
+def _migrate_v2(c):
+    c.execute('''ALTER TABLE reminders ADD COLUMN claimed_until INTEGER''')
+    c.execute('''CREATE INDEX idx_reminders_claimed ON reminders (claimed_until) WHERE claimed_until IS NOT NULL''')
+
+
+# v3: discount_notified marks reminders already announced in the "уценка" digest
+def _migrate_v3(c):
+    c.execute('''ALTER TABLE reminders ADD COLUMN discount_notified INTEGER NOT NULL DEFAULT 0''')
+    c.execute('''CREATE INDEX idx_reminders_discount ON reminders (reminder_date) WHERE discount_notified = 0''')
+
+
+# v4: conversations keeps the reminder wizard state per chat, shared by all bot processes
+def _migrate_v4(c):
+    c.execute('''CREATE TABLE conversations (
+        chat_id INTEGER PRIMARY KEY,
+        step TEXT NOT NULL,
+        data TEXT NOT NULL,
+        expires_at INTEGER NOT NULL)''')
+    c.execute('''CREATE INDEX idx_conversations_expires ON conversations (expires_at)''')
+
+
+# v5: leases holds the scheduler leader lease shared by bot replicas
+def _migrate_v5(c):
+    c.execute('''CREATE TABLE leases (
+        name TEXT PRIMARY KEY,
+        holder TEXT NOT NULL,
+        expires_at REAL NOT NULL)''')
+
+
+# v6: recurrence rule (every repeat_every days/weeks/months until repeat_until); NULL unit = one-time
+def _migrate_v6(c):
+    c.execute('''ALTER TABLE reminders ADD COLUMN repeat_unit TEXT''')
+    c.execute('''ALTER TABLE reminders ADD COLUMN repeat_every INTEGER''')
+    c.execute('''ALTER TABLE reminders ADD COLUMN repeat_until INTEGER''')
+
+
+# Text as it goes into the FTS index: unicode61 folds case but not ё, so ё -> е
+# here and in search queries
+FTS_TEXT = "replace(replace({0}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+# v7: FTS5 index over reminder_text, kept in sync by triggers. Prefix indexes make
+# "молок*" style queries cheap. The index holds FTS_TEXT of each row, so it must
+# be filled with FTS_TEXT too ('rebuild' would index the raw text).
+def _migrate_v7(c):
+    c.execute('''CREATE VIRTUAL TABLE reminders_fts USING fts5(
+        reminder_text,
+        content = 'reminders',
+        content_rowid = 'id',
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3')''')
+    c.execute(f'''CREATE TRIGGER reminders_fts_insert AFTER INSERT ON reminders BEGIN
+        INSERT INTO reminders_fts (rowid, reminder_text) VALUES (new.id, {FTS_TEXT.format('new.reminder_text')});
+    END''')
+    c.execute(f'''CREATE TRIGGER reminders_fts_delete AFTER DELETE ON reminders BEGIN
+        INSERT INTO reminders_fts (reminders_fts, rowid, reminder_text) VALUES ('delete', old.id, {FTS_TEXT.format('old.reminder_text')});
+    END''')
+    c.execute(f'''CREATE TRIGGER reminders_fts_update AFTER UPDATE OF reminder_text ON reminders BEGIN
+        INSERT INTO reminders_fts (reminders_fts, rowid, reminder_text) VALUES ('delete', old.id, {FTS_TEXT.format('old.reminder_text')});
+        INSERT INTO reminders_fts (rowid, reminder_text) VALUES (new.id, {FTS_TEXT.format('new.reminder_text')});
+    END''')
+    c.execute(f'''INSERT INTO reminders_fts (rowid, reminder_text) SELECT id, {FTS_TEXT.format('reminder_text')} FROM reminders''')
+
+
+# Each migration brings the schema from version N to N + 1 (PRAGMA user_version)
+MIGRATIONS = [_migrate_v1, _migrate_v2, _migrate_v3, _migrate_v4, _migrate_v5, _migrate_v6, _migrate_v7]
+
+
+# Replicas may start together: the version is re-read under the write lock, so a
+# migration another process has just applied is skipped rather than replayed
+def migrate(conn):
+    c = conn.cursor()
+    for target, migration in enumerate(MIGRATIONS, start=1):
+        if c.execute('''PRAGMA user_version''').fetchone()[0] >= target:
+            continue
+        c.execute('''BEGIN IMMEDIATE''')
+        try:
+            if c.execute('''PRAGMA user_version''').fetchone()[0] < target:
+                migration(c)
+                c.execute(f'''PRAGMA user_version = {target}''')
+            c.execute('''COMMIT''')
+        except Exception:
+            c.execute('''ROLLBACK''')
+            raise
+
+
+# Create or upgrade the database, open the read pool and start the writer thread
+def init():
+    global _writer_thread
+    if _writer_thread is not None:
+        return
+    conn = _connect()
+    migrate(conn)
+    # Freed pages (e.g. dropped archive months) are returned by PRAGMA incremental_vacuum.
+    # Switching an existing file over needs one full VACUUM, which can't run in a transaction.
+    if conn.execute('''PRAGMA auto_vacuum''').fetchone()[0] != 2:
+        conn.execute('''PRAGMA auto_vacuum = INCREMENTAL''')
+        conn.execute('''VACUUM''')
+    conn.close()
+    for _ in range(READ_POOL_SIZE):
+        _read_pool.put(_connect())
+    _writer_thread = threading.Thread(target=_writer_loop, daemon=True)
+    _writer_thread.start()
+
+
+# Return free pages to the file system (auto_vacuum = INCREMENTAL). Runs on its own
+# connection outside the writer's group transaction; executescript steps the pragma
+# to completion, a plain execute() frees a single page.
+def incremental_vacuum():
+    conn = _connect()
+    try:
+        conn.executescript('''PRAGMA incremental_vacuum;''')
+    finally:
+        conn.close()
+
+
+@contextmanager
+def reader():
+    conn = _read_pool.get()
+    try:
+        yield conn
+    finally:
+        _read_pool.put(conn)
+
+
+def query(sql, params=()):
+    with reader() as conn, QUERY_SECONDS.time(site=metrics.call_site(), kind='read'):
+        return conn.execute(sql, params).fetchall()
+
+
+# Queue fn(conn) for the writer thread. The returned Future resolves to fn's
+# result once the transaction it ran in has been committed.
+def write(fn, site=None):
+    future = Future()
+    _write_queue.put((fn, future, site or metrics.call_site()))
+    return future
+
+
+def execute(sql, params=()):
+    return write(lambda conn: conn.execute(sql, params).lastrowid, metrics.call_site()).result()
+
+
+def executemany(sql, seq_of_params):
+    return write(lambda conn: conn.executemany(sql, seq_of_params).rowcount, metrics.call_site()).result()
+
+
+def write_queue_depth():
+    return _write_queue.qsize()
+
+
+metrics.Gauge('sqlite_write_queue_depth', 'Write operations waiting for the writer thread', write_queue_depth)
+
+
+# Single writer: drains whatever is queued and applies it in one transaction
+# (group commit). Each operation runs in its own savepoint, so a failing one
+# is rolled back alone and doesn't take the rest of the group with it.
+def _writer_loop():
+    conn = _connect()
+    while True:
+        ops = [_write_queue.get()]
+        while len(ops) < GROUP_COMMIT_MAX:
+            try:
+                ops.append(_write_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        results = []
+        try:
+            conn.execute('''BEGIN IMMEDIATE''')
+            for fn, future, site in ops:
+                conn.execute('''SAVEPOINT op''')
+                try:
+                    with QUERY_SECONDS.time(site=site, kind='write'):
+                        results.append((future, fn(conn), None))
+                    conn.execute('''RELEASE op''')
+                except Exception as e:
+                    conn.execute('''ROLLBACK TO op''')
+                    conn.execute('''RELEASE op''')
+                    results.append((future, None, e))
+            with COMMIT_SECONDS.time():
+                conn.execute('''COMMIT''')
+            COMMIT_GROUP_SIZE.observe(len(ops))
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute('''ROLLBACK''')
+            results = [(future, None, e) for _, future, _ in ops]
+
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
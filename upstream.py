@@ -0,0 +1,158 @@
+import http.client
+import queue
+import ssl
+import threading
+import time
+from urllib.parse import urlsplit
+
+# Persistent connections kept per upstream; also the max requests in flight to it
+POOL_SIZE = 8
+
+# Idle connections older than this are closed instead of reused (servers drop them anyway)
+IDLE_TIMEOUT = 30.0
+
+# Socket timeout for connect and each read
+REQUEST_TIMEOUT = 20.0
+
+
+# Failures after which the breaker opens, and how long it stays open before a probe
+BREAKER_THRESHOLD = 5
+BREAKER_RESET = 30.0
+
+
+class PoolTimeout(TimeoutError):
+    pass
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class CircuitOpen(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__('upstream circuit is open')
+        self.retry_after = retry_after
+
+
+# Bounded pool of keep-alive HTTP(S) connections to one base URL. The TLS
+# handshake is paid once per connection instead of once per request.
+class ConnectionPool:
+    def __init__(self, base_url: str, size: int = POOL_SIZE, timeout: float = REQUEST_TIMEOUT):
+        url = urlsplit(base_url)
+        self.scheme = url.scheme
+        self.host = url.hostname
+        self.port = url.port or (443 if url.scheme == 'https' else 80)
+        self.prefix = url.path.rstrip('/')
+        self.timeout = timeout
+        self.ssl_context = ssl.create_default_context() if url.scheme == 'https' else None
+        # (connection, last used), most recently used on top
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+
+    def _new_connection(self):
+        if self.scheme == 'https':
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout, context=self.ssl_context)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _idle_connection(self):
+        while True:
+            try:
+                conn, last_used = self.idle.get_nowait()
+            except queue.Empty:
+                return None
+            if time.monotonic() - last_used < IDLE_TIMEOUT:
+                return conn
+            conn.close()
+
+    # Socket timeout for the next step: what is left of the deadline, capped by the pool's timeout
+    def _time_left(self, deadline: float | None) -> float:
+        if deadline is None:
+            return self.timeout
+        left = deadline - time.monotonic()
+        if left <= 0:
+            raise DeadlineExceeded(f'deadline exceeded calling {self.host}')
+        return min(left, self.timeout)
+
+    @staticmethod
+    def _set_timeout(conn, timeout: float):
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+
+    # Send a request to base URL + path; returns (status, headers, body).
+    # `deadline` (time.monotonic() value) bounds the wait for a connection and every
+    # socket operation. A reused connection the server has already closed is retried
+    # once on a new one, so only use this for requests that are safe to repeat.
+    def request(self, method: str, path: str, body: bytes | None = None, headers: dict | None = None, deadline: float | None = None):
+        if not self.slots.acquire(timeout=self._time_left(deadline)):
+            raise PoolTimeout(f'no free connection to {self.host}')
+        try:
+            conn = self._idle_connection()
+            reused = conn is not None
+            while True:
+                if conn is None:
+                    conn = self._new_connection()
+                try:
+                    self._set_timeout(conn, self._time_left(deadline))
+                    conn.request(method, self.prefix + path, body=body, headers=headers or {})
+                    self._set_timeout(conn, self._time_left(deadline))
+                    resp = conn.getresponse()
+                    data = resp.read()
+                except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                    conn.close()
+                    if not reused:
+                        raise
+                    conn, reused = None, False
+                    continue
+                except Exception:
+                    conn.close()
+                    raise
+                break
+
+            if resp.will_close:
+                conn.close()
+            else:
+                self.idle.put((conn, time.monotonic()))
+            return resp.status, resp.headers, data
+        finally:
+            self.slots.release()
+
+
+# Stops calls to an upstream that keeps failing. After `threshold` failures in a
+# row the circuit opens and allow() raises CircuitOpen for `reset_timeout`
+# seconds; then one probe call is let through (half-open). Its success closes
+# the circuit, its failure opens it again.
+class CircuitBreaker:
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, reset_timeout: float = BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def state(self) -> str:
+        with self.lock:
+            if self.opened_at is None:
+                return 'closed'
+            return 'half-open' if self.probing or time.monotonic() - self.opened_at >= self.reset_timeout else 'open'
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            wait = self.opened_at + self.reset_timeout - time.monotonic()
+            if wait > 0 or self.probing:
+                raise CircuitOpen(max(wait, 1.0))
+            self.probing = True
+
+    def record(self, ok: bool):
+        with self.lock:
+            self.probing = False
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
@@ -0,0 +1,102 @@
+import hmac
+import json
+import queue
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import metrics
+
+# Updates waiting per worker before the endpoint starts answering 503
+# (Telegram then redelivers the update later)
+WORKER_QUEUE_SIZE = 1000
+
+
+# Chat the update belongs to; updates of one chat must be handled in order
+def update_chat_id(update):
+    for key in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+        if key in update:
+            return update[key].get('chat', {}).get('id')
+    callback = update.get('callback_query')
+    if callback:
+        return (callback.get('message') or {}).get('chat', {}).get('id') or callback.get('from', {}).get('id')
+    return update.get('update_id')
+
+
+# Bounded pool of workers. All updates of a chat go to the same worker, so
+# they are handled in order, while different chats run in parallel.
+class UpdateDispatcher:
+    def __init__(self, handle_update, workers=8):
+        self.handle_update = handle_update
+        self.queues = [queue.Queue(WORKER_QUEUE_SIZE) for _ in range(workers)]
+        for worker_queue in self.queues:
+            threading.Thread(target=self._worker, args=(worker_queue,), daemon=True).start()
+
+    # False if the chat's worker is full
+    def submit(self, update):
+        worker_queue = self.queues[hash(update_chat_id(update)) % len(self.queues)]
+        try:
+            worker_queue.put_nowait(update)
+        except queue.Full:
+            return False
+        return True
+
+    def depth(self):
+        return sum(worker_queue.qsize() for worker_queue in self.queues)
+
+    def _worker(self, worker_queue):
+        while True:
+            update = worker_queue.get()
+            try:
+                self.handle_update(update)
+            except Exception as e:
+                print(f"An error occurred: {e}")
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    dispatcher = None
+    path_prefix = '/webhook'
+    secret = ''
+
+    def do_POST(self):
+        if self.path != self.path_prefix:
+            self._reply(404)
+            return
+        # Telegram echoes the secret_token given to setWebhook in this header
+        if self.secret and not hmac.compare_digest(self.headers.get('X-Telegram-Bot-Api-Secret-Token', ''), self.secret):
+            self._reply(403)
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            update = json.loads(self.rfile.read(length).decode('utf-8'))
+        except Exception:
+            self._reply(400)
+            return
+
+        self._reply(200 if self.dispatcher.submit(update) else 503)
+
+    def _reply(self, status):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        # Every update is a request; don't print them
+        pass
+
+
+# Serve the webhook endpoint until interrupted; handle_update(dict) is called from the worker pool
+def serve(handle_update, host='0.0.0.0', port=8443, path='/webhook', secret='', workers=8):
+    dispatcher = UpdateDispatcher(handle_update, workers)
+    metrics.Gauge('webhook_queue_depth', 'Updates waiting for a webhook worker', dispatcher.depth)
+    handler = type('BotWebhookHandler', (WebhookHandler,), {
+        'dispatcher': dispatcher,
+        'path_prefix': path,
+        'secret': secret,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"Webhook endpoint on http://{host}:{port}{path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down...")
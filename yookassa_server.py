@@ -2,31 +2,127 @@ import os
 import json
 import uuid
 import base64
-from http.server import HTTPServer, BaseHTTPRequestHandler
-import urllib.request
-import urllib.error
+import math
+import threading
+import time
+from http.server import HTTPServer, ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
 
-YOOKASSA_API = 'https://api.yookassa.ru/v3/payments'
+import idempotency
+import payment_status
+import ratelimit
+import upstream
+
+# YooKassa API base URL; point it at a local mock to test the gateway
+YOOKASSA_BASE_URL = os.getenv('YOOKASSA_BASE_URL') or 'https://api.yookassa.ru/v3'
+
+# Keep-alive connections to YooKassa, shared by all request threads
+yookassa = upstream.ConnectionPool(YOOKASSA_BASE_URL, size=int(os.getenv('UPSTREAM_POOL_SIZE') or upstream.POOL_SIZE))
+
+# Time budget for one create-payment request, from arrival to the upstream's answer
+PAYMENT_DEADLINE = float(os.getenv('PAYMENT_DEADLINE') or 10)
+
+# Create-payment requests handled at once; more get 503 right away
+MAX_IN_FLIGHT = int(os.getenv('MAX_IN_FLIGHT') or 32)
+in_flight = threading.BoundedSemaphore(MAX_IN_FLIGHT)
+
+# Fails fast with 503 while YooKassa keeps failing or timing out
+breaker = upstream.CircuitBreaker()
+
+# Created payments by (Idempotency-Key, amount): repeats are answered from memory and
+# concurrent duplicates share one upstream call. Only successes are kept.
+payments = idempotency.IdempotentCalls(cacheable=lambda response: response[0] == 200)
+
+# Latest known status per payment, from create-payment answers and YooKassa notifications
+payment_store = payment_status.PaymentStatusStore(os.getenv('PAYMENTS_DB') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'payments.db'))
+
+# Where YooKassa posts notifications, and who may post them
+# (e.g. YOOKASSA_NOTIFY_ALLOW=127.0.0.1/32 for the local stand-in, fake_notifications.py)
+NOTIFY_PATH = '/api/yookassa-notification'
+notify_allowlist = payment_status.Allowlist((os.getenv('YOOKASSA_NOTIFY_ALLOW') or ','.join(payment_status.YOOKASSA_NETWORKS)).split(','))
+
+# Per-client limits by route ("rate,burst" env vars: requests per second, burst size).
+# Every payment costs an upstream call, so allow a few retries and not much more.
+RATE_LIMITS = {
+	'/api/create-payment': ratelimit.from_env('PAYMENT_RATE_LIMIT', 0.2, 5),
+}
 
 
 class Handler(BaseHTTPRequestHandler):
 	def _set_cors(self):
 		self.send_header('Access-Control-Allow-Origin', '*')
-		self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-		self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+		self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+		self.send_header('Access-Control-Allow-Headers', 'Content-Type, Idempotency-Key')
 
 	def do_OPTIONS(self):
 		self.send_response(204)
 		self._set_cors()
+		self.send_header('Content-Length', '0')
+		self.end_headers()
+
+	def _send_json(self, status, payload, headers=None):
+		body = json.dumps(payload).encode('utf-8')
+		self.send_response(status)
+		self._set_cors()
+		self.send_header('Content-Type', 'application/json; charset=utf-8')
+		self.send_header('Content-Length', str(len(body)))
+		for name, value in (headers or {}).items():
+			self.send_header(name, value)
 		self.end_headers()
+		self.wfile.write(body)
+
+	# Reply without reading the request body; what is left of it would be parsed as the
+	# next request, so the keep-alive connection is closed
+	def _send_json_and_close(self, status, payload, headers=None):
+		self.close_connection = True
+		self._send_json(status, payload, dict(headers or {}, Connection='close'))
+
+	# GET /api/payment-status?payment_id=... answers from the local store, without calling YooKassa
+	def do_GET(self):
+		url = urlparse(self.path)
+		if url.path != '/api/payment-status':
+			self._send_json(404, {'error': 'not_found'})
+			return
+		payment_id = (parse_qs(url.query).get('payment_id') or [''])[0]
+		entry = payment_store.get(payment_id) if payment_id else None
+		if entry is None:
+			self._send_json(404, {'error': 'unknown_payment'})
+			return
+		self._send_json(200, entry)
+
+	# YooKassa notification (payment.succeeded, payment.canceled, ...): store the new status
+	def _handle_notification(self):
+		if ratelimit.client_ip(self) not in notify_allowlist:
+			self._send_json_and_close(403, {'error': 'forbidden'})
+			return
+		length = int(self.headers.get('Content-Length') or 0)
+		try:
+			notification = json.loads(self.rfile.read(length).decode('utf-8') or '{}')
+			payment_id = payment_store.apply_notification(notification)
+		except ValueError as e:
+			self._send_json(400, {'error': 'invalid_notification', 'details': str(e)})
+			return
+		except Exception as e:
+			print(f"An error occurred: {e}")
+			# Anything but 200 makes YooKassa deliver the notification again later
+			self._send_json(500, {'error': 'store_error'})
+			return
+		# Events about refunds and other objects are acknowledged and dropped, so they aren't redelivered
+		self._send_json(200, {'ok': True, 'ignored': payment_id is None})
 
 	def do_POST(self):
-		if self.path != '/api/create-payment':
-			self.send_response(404)
-			self._set_cors()
-			self.send_header('Content-Type', 'application/json; charset=utf-8')
-			self.end_headers()
-			self.wfile.write(b'{"error":"not_found"}')
+		deadline = time.monotonic() + PAYMENT_DEADLINE
+		path = urlparse(self.path).path
+		if path == NOTIFY_PATH:
+			self._handle_notification()
+			return
+		if path != '/api/create-payment':
+			self._send_json_and_close(404, {'error': 'not_found'})
+			return
+
+		wait = RATE_LIMITS[path].check(ratelimit.client_ip(self))
+		if wait:
+			self._send_json_and_close(429, {'error': 'rate_limited'}, {'Retry-After': ratelimit.retry_after_header(wait)})
 			return
 
 		length = int(self.headers.get('Content-Length') or 0)
@@ -37,21 +133,13 @@ class Handler(BaseHTTPRequestHandler):
 			amount = max(10.0, amount)
 			amount_str = f"{amount:.2f}"
 		except Exception as e:
-			self.send_response(400)
-			self._set_cors()
-			self.send_header('Content-Type', 'application/json; charset=utf-8')
-			self.end_headers()
-			self.wfile.write(json.dumps({'error': 'invalid_request', 'details': str(e)}).encode('utf-8'))
+			self._send_json(400, {'error': 'invalid_request', 'details': str(e)})
 			return
 
 		shop_id = os.getenv('YOOKASSA_SHOP_ID', '')
 		secret_key = os.getenv('YOOKASSA_SECRET_KEY', '')
 		if not shop_id or not secret_key:
-			self.send_response(500)
-			self._set_cors()
-			self.send_header('Content-Type', 'application/json; charset=utf-8')
-			self.end_headers()
-			self.wfile.write(json.dumps({'error': 'missing_credentials', 'hint': 'Set env vars YOOKASSA_SHOP_ID and YOOKASSA_SECRET_KEY'}).encode('utf-8'))
+			self._send_json(500, {'error': 'missing_credentials', 'hint': 'Set env vars YOOKASSA_SHOP_ID and YOOKASSA_SECRET_KEY'})
 			return
 
 		payload = {
@@ -64,52 +152,92 @@ class Handler(BaseHTTPRequestHandler):
 			'description': 'Donation to breathing meditation'
 		}
 
-		didem_key = str(uuid.uuid4())
+		# A key sent by the page is reused when the same donation is retried, so
+		# YooKassa and the cache below see it as one payment
+		client_key = self.headers.get('Idempotency-Key') or ''
+		if client_key and not idempotency.valid_key(client_key):
+			self._send_json(400, {'error': 'invalid_idempotency_key'})
+			return
+
+		idem_key = client_key or str(uuid.uuid4())
 		basic = base64.b64encode(f"{shop_id}:{secret_key}".encode('utf-8')).decode('utf-8')
 		headers = {
 			'Content-Type': 'application/json',
-			'Idempotence-Key': didem_key,
+			'Idempotence-Key': idem_key,
 			'Authorization': f'Basic {basic}',
 			'Accept': 'application/json'
 		}
 
-		req = urllib.request.Request(YOOKASSA_API, data=json.dumps(payload).encode('utf-8'), headers=headers, method='POST')
+		# Shed load instead of queueing behind a slow upstream
+		if not in_flight.acquire(blocking=False):
+			self._send_json(503, {'error': 'overloaded'}, {'Retry-After': '1'})
+			return
 		try:
-			with urllib.request.urlopen(req, timeout=20) as resp:
-				resp_body = resp.read().decode('utf-8')
-				resp_json = json.loads(resp_body)
-				confirmation_url = (resp_json.get('confirmation') or {}).get('confirmation_url')
-				self.send_response(200)
-				self._set_cors()
-				self.send_header('Content-Type', 'application/json; charset=utf-8')
-				self.end_headers()
-				self.wfile.write(json.dumps({
-					'confirmation_url': confirmation_url,
-					'checkoutUrl': confirmation_url,
-					'payment_id': resp_json.get('id')
-				}).encode('utf-8'))
-		except urllib.error.HTTPError as e:
-			err = e.read().decode('utf-8', errors='ignore')
-			try:
-				err_json = json.loads(err)
-			except Exception:
-				err_json = {'raw': err}
-			self.send_response(e.code)
-			self._set_cors()
-			self.send_header('Content-Type', 'application/json; charset=utf-8')
-			self.end_headers()
-			self.wfile.write(json.dumps({'error': 'yookassa_error', 'status': e.code, 'details': err_json}).encode('utf-8'))
-		except Exception as e:
-			self.send_response(502)
-			self._set_cors()
-			self.send_header('Content-Type', 'application/json; charset=utf-8')
-			self.end_headers()
-			self.wfile.write(json.dumps({'error': 'gateway_error', 'details': str(e)}).encode('utf-8'))
+			if client_key:
+				status, result = payments.run((client_key, amount_str), lambda: create_payment(payload, headers, deadline))
+			else:
+				status, result = create_payment(payload, headers, deadline)
+		finally:
+			in_flight.release()
+		self._send_json(status, result, {'Retry-After': str(result['retry_after'])} if 'retry_after' in result else None)
+
+
+# Create the payment at YooKassa within the request's deadline; returns (status, response body for the page)
+def create_payment(payload, headers, deadline):
+	try:
+		breaker.allow()
+	except upstream.CircuitOpen as e:
+		return 503, {'error': 'upstream_unavailable', 'retry_after': math.ceil(e.retry_after)}
+
+	try:
+		status, _, resp_body = yookassa.request('POST', '/payments', body=json.dumps(payload).encode('utf-8'), headers=headers, deadline=deadline)
+	except TimeoutError as e:
+		breaker.record(False)
+		return 504, {'error': 'gateway_timeout', 'details': str(e)}
+	except Exception as e:
+		breaker.record(False)
+		return 502, {'error': 'gateway_error', 'details': str(e)}
+	breaker.record(status < 500)
+
+	try:
+		if status < 400:
+			resp_json = json.loads(resp_body.decode('utf-8'))
+	except Exception as e:
+		return 502, {'error': 'gateway_error', 'details': str(e)}
+
+	if status >= 400:
+		err = resp_body.decode('utf-8', errors='ignore')
+		try:
+			err_json = json.loads(err)
+		except Exception:
+			err_json = {'raw': err}
+		return status, {'error': 'yookassa_error', 'status': status, 'details': err_json}
+
+	try:
+		amount = resp_json.get('amount') or {}
+		payment_store.record(str(resp_json['id']), resp_json.get('status') or 'pending', amount.get('value'), amount.get('currency'))
+	except Exception as e:
+		print(f"An error occurred: {e}")
+
+	confirmation_url = (resp_json.get('confirmation') or {}).get('confirmation_url')
+	return 200, {
+		'confirmation_url': confirmation_url,
+		'checkoutUrl': confirmation_url,
+		'payment_id': resp_json.get('id')
+	}
+
+
+class GatewayServer(ThreadingHTTPServer):
+	# Listen backlog; with the default of 5 a burst of donors overflows it and
+	# their connections are dropped or delayed by a SYN retry
+	request_queue_size = 128
 
 
 def run():
 	port = int(os.getenv('PORT') or '8787')
-	server = HTTPServer(('', port), Handler)
+	# SERVER_MODE=single keeps the old one-request-at-a-time server
+	server_class = HTTPServer if os.getenv('SERVER_MODE') == 'single' else GatewayServer
+	server = server_class(('', port), Handler)
 	print(f"YooKassa API server on http://localhost:{port}")
 	server.serve_forever()
 